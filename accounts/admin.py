@@ -1,5 +1,9 @@
+import json
+
+from django.conf.urls import patterns, url
 from django.contrib import admin, messages
 from django.contrib.auth.admin import UserAdmin as DjangoUserAdmin
+from accounts import directory
 from accounts.models import User
 from accounts.forms import UserChangeForm, UserCreationForm
 from django.utils.translation import ugettext, ugettext_lazy as _
@@ -7,7 +11,7 @@ from django.contrib.sites.models import RequestSite, Site
 from django.views.decorators.debug import sensitive_post_parameters
 from django.core.exceptions import PermissionDenied
 from django.shortcuts import get_object_or_404
-from django.http import HttpResponseRedirect
+from django.http import HttpResponse, HttpResponseRedirect
 from django.utils.html import escape
 from django.template.response import TemplateResponse
 
@@ -34,6 +38,28 @@ class UserAdmin(DjangoUserAdmin):
     ordering = ('email',)
     filter_horizontal = ('groups', 'user_permissions')
 
+    def get_urls(self):
+        return patterns('',
+            url(r'^autocomplete/$', self.admin_site.admin_view(self.autocomplete),
+                name='accounts_user_autocomplete'),
+        ) + super(UserAdmin, self).get_urls()
+
+    def autocomplete(self, request):
+        """
+        JSON list of the users whose email starts with ``q``, from the in-memory email directory.
+        """
+        if not self.has_change_permission(request):
+            raise PermissionDenied
+        prefix = request.GET.get('q', '').strip()
+        try:
+            limit = min(int(request.GET.get('limit', 20)), 100)
+        except ValueError:
+            limit = 20
+        results = prefix and directory.search(prefix, limit) or []
+        return HttpResponse(json.dumps([{'email': email, 'pk': pk, 'is_active': is_active}
+                                        for email, pk, is_active in results]),
+                            content_type='application/json')
+
     def activate_users(self, request, queryset):
         for user in queryset:
             User.objects.activate_user(user.activation_key)
@@ -0,0 +1,189 @@
+"""
+In-memory directory of the users' emails, for prefix lookups that don't touch the database.
+
+Each process keeps, per shard, the lowercased emails sorted in a list of
+byte strings, with the primary keys in an ``array`` and the ``is_active``
+flags in a ``bytearray`` at the same positions: about 80 MB per million
+users with 25 character emails, against several kilobytes per user as
+model instances.
+
+A directory is built on first use. Saves and deletes in this process
+update it right away. Users created elsewhere (other processes, bulk
+inserts) are picked up every ``EMAIL_DIRECTORY_REFRESH_INTERVAL`` seconds
+by looking for users that joined since the last look. Anything else done
+elsewhere, like activations and deletions, shows up when the directory is
+rebuilt, every ``EMAIL_DIRECTORY_REBUILD_INTERVAL`` seconds.
+"""
+import sys
+import threading
+import time
+from array import array
+from bisect import bisect_left
+
+from django.conf import settings
+from django.db.models.signals import post_delete, post_save
+
+from accounts.models import User
+from accounts.sharding import user_shards
+
+_directories = {}
+_lock = threading.Lock()
+
+
+def _key(email):
+    return email.lower().encode('utf-8')
+
+
+class EmailDirectory(object):
+    def __init__(self, alias):
+        self.alias = alias
+        self.lock = threading.RLock()
+        self.updating = threading.Lock()
+        self.emails = []
+        self.pks = array('l')
+        self.active = bytearray()
+        self.built_at = self.refreshed_at = 0
+        self.joined_since = None
+
+    def __len__(self):
+        return len(self.emails)
+
+    def build(self):
+        rows = []
+        joined_since = None
+        start = time.time()
+        for email, pk, is_active, date_joined in (User.objects.using(self.alias).order_by()
+                                                  .values_list('email', 'pk', 'is_active', 'date_joined')
+                                                  .iterator()):
+            rows.append((_key(email), pk, is_active))
+            if joined_since is None or date_joined > joined_since:
+                joined_since = date_joined
+        rows.sort()
+        with self.lock:
+            self.emails = [email for email, pk, is_active in rows]
+            self.pks = array('l', (pk for email, pk, is_active in rows))
+            self.active = bytearray(is_active and 1 or 0 for email, pk, is_active in rows)
+            self.built_at = self.refreshed_at = start
+            self.joined_since = joined_since
+
+    def refresh(self):
+        """
+        Add the users who joined since the last build or refresh.
+        """
+        users = User.objects.using(self.alias).order_by()
+        if self.joined_since is not None:
+            users = users.filter(date_joined__gte=self.joined_since)
+        self.refreshed_at = time.time()
+        for email, pk, is_active, date_joined in users.values_list('email', 'pk', 'is_active', 'date_joined'):
+            # Users whose email changed elsewhere are only moved by the rebuild.
+            self.put(email, pk, is_active, new=True)
+            if self.joined_since is None or date_joined > self.joined_since:
+                self.joined_since = date_joined
+
+    def update(self):
+        """
+        Rebuild or refresh the directory if it is time to.
+
+        Only the first build makes other threads wait; afterwards they go
+        on with the directory as it is while one thread updates it.
+        """
+        if not self.updating.acquire(not self.built_at):
+            return
+        try:
+            now = time.time()
+            if now - self.built_at > getattr(settings, 'EMAIL_DIRECTORY_REBUILD_INTERVAL', 3600):
+                self.build()
+            elif now - self.refreshed_at > getattr(settings, 'EMAIL_DIRECTORY_REFRESH_INTERVAL', 60):
+                self.refresh()
+        finally:
+            self.updating.release()
+
+    def _position(self, pk):
+        try:
+            return self.pks.index(pk)
+        except ValueError:
+            return None
+
+    def put(self, email, pk, is_active, new=False):
+        """
+        Add or update a user; ``new`` when it can't be in the directory yet, which saves looking for it by pk.
+        """
+        key = _key(email)
+        with self.lock:
+            i = bisect_left(self.emails, key)
+            if i < len(self.emails) and self.emails[i] == key and self.pks[i] == pk:
+                self.active[i] = is_active and 1 or 0
+                return
+            if not new:
+                # The email of an existing user may have changed: a scan of the pks.
+                self.remove(pk)
+            i = bisect_left(self.emails, key)
+            self.emails.insert(i, key)
+            self.pks.insert(i, pk)
+            self.active.insert(i, is_active and 1 or 0)
+
+    def remove(self, pk):
+        with self.lock:
+            i = self._position(pk)
+            if i is not None:
+                del self.emails[i]
+                del self.pks[i]
+                del self.active[i]
+
+    def search(self, prefix, limit):
+        """
+        The first ``limit`` ``(email, pk, is_active)`` whose email starts with ``prefix``.
+        """
+        prefix = _key(prefix)
+        results = []
+        with self.lock:
+            i = bisect_left(self.emails, prefix)
+            while i < len(self.emails) and len(results) < limit and self.emails[i].startswith(prefix):
+                results.append((self.emails[i].decode('utf-8'), self.pks[i], bool(self.active[i])))
+                i += 1
+        return results
+
+    def memory(self):
+        """
+        Bytes held by the directory.
+        """
+        with self.lock:
+            return (sys.getsizeof(self.emails) + sum(sys.getsizeof(email) for email in self.emails) +
+                    sys.getsizeof(self.pks) + sys.getsizeof(self.active))
+
+
+def get_directory(alias):
+    """
+    The up to date directory of the users of ``alias``.
+    """
+    with _lock:
+        directory = _directories.get(alias)
+        if directory is None:
+            directory = _directories[alias] = EmailDirectory(alias)
+    directory.update()
+    return directory
+
+
+def search(prefix, limit=20):
+    """
+    The first ``limit`` ``(email, pk, is_active)`` of every shard whose email starts with ``prefix``.
+    """
+    results = []
+    for alias in user_shards():
+        results.extend(get_directory(alias).search(prefix, limit))
+    return sorted(results)[:limit]
+
+
+def user_saved(sender, instance, using, created, **kwargs):
+    directory = _directories.get(using)
+    if directory is not None:
+        directory.put(instance.email, instance.pk, instance.is_active, new=created)
+
+
+def user_deleted(sender, instance, using, **kwargs):
+    directory = _directories.get(using)
+    if directory is not None:
+        directory.remove(instance.pk)
+
+post_save.connect(user_saved, sender=User, dispatch_uid='accounts.directory')
+post_delete.connect(user_deleted, sender=User, dispatch_uid='accounts.directory')
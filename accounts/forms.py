@@ -1,12 +1,28 @@
 from django import forms
 from django.contrib.auth.forms import ReadOnlyPasswordHashField
+from accounts.hashers import must_update, rehash_password
 from accounts.models import User
+from accounts.sharding import is_sharded, on_shard, shard_for_email, shards_starting_with
 from django.utils.translation import ugettext_lazy as _
 from django.conf import settings
-from django.contrib.auth.forms import AuthenticationForm
+from django.contrib.auth.forms import AuthenticationForm, PasswordResetForm
 
 
-class UserCreationForm(forms.ModelForm):
+class ShardUniqueEmailMixin(object):
+    """
+    Check that the email is free on its shard: ``validate_unique`` only queries the default database.
+    """
+
+    def clean_email(self):
+        email = self.cleaned_data['email']
+        if is_sharded():
+            normalized = User.objects.normalize_email(email)
+            if User.objects.db_manager(shard_for_email(normalized)).filter(email=normalized).exists():
+                raise forms.ValidationError(self.instance.unique_error_message(User, ('email',)))
+        return email
+
+
+class UserCreationForm(ShardUniqueEmailMixin, forms.ModelForm):
     error_messages = {
         'password_mismatch': _("The two password fields didn't match."),
     }
@@ -43,6 +59,23 @@ class UserCreationForm(forms.ModelForm):
         return user
 
 
+class BulkUserCreationForm(UserCreationForm):
+    """
+    ``UserCreationForm`` for the bulk registration API: no captcha, and
+    email uniqueness checked by the caller for a whole chunk at once.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super(BulkUserCreationForm, self).__init__(*args, **kwargs)
+        self.fields.pop('captcha', None)
+
+    def clean_email(self):
+        return self.cleaned_data['email']
+
+    def validate_unique(self):
+        pass
+
+
 class UserChangeForm(forms.ModelForm):
     password = ReadOnlyPasswordHashField(label=_("Password"),
                                          help_text=_("Raw passwords are not stored, so there is no way to see "
@@ -66,8 +99,15 @@ class UserAuthenticationForm(AuthenticationForm):
         'inactive': _("This account is inactive."),
     }
 
+    def clean(self):
+        cleaned_data = super(UserAuthenticationForm, self).clean()
+        user = self.get_user()
+        if user is not None and must_update(user.password):
+            rehash_password(user, cleaned_data['password'])
+        return cleaned_data
+
 
-class AdminUserCreationForm(forms.ModelForm):
+class AdminUserCreationForm(ShardUniqueEmailMixin, forms.ModelForm):
     error_messages = {
         'password_mismatch': _("The two password fields didn't match."),
     }
@@ -93,3 +133,21 @@ class AdminUserCreationForm(forms.ModelForm):
         if commit:
             user.save()
         return user
+
+
+class UserPasswordResetForm(PasswordResetForm):
+    """
+    ``PasswordResetForm`` looking the email up on its shard, then on the others.
+    """
+
+    def clean_email(self):
+        email = self.cleaned_data['email']
+        error = None
+        for alias in shards_starting_with(shard_for_email(email)):
+            with on_shard(alias):
+                try:
+                    return super(UserPasswordResetForm, self).clean_email()
+                except forms.ValidationError as e:
+                    # The email's own shard tells best why it can't be reset.
+                    error = error or e
+        raise error
@@ -0,0 +1,135 @@
+"""
+Password hashers running PBKDF2 in a process pool.
+
+PBKDF2 holds the GIL for the whole hash, so a thread hashing a password
+stalls every other thread of the process. ``PooledPBKDF2PasswordHasher``
+hands the hashing over to a pool of ``PASSWORD_HASHING_PROCESSES``
+processes. At most ``PASSWORD_HASHING_QUEUE_SIZE`` hashes wait for or run
+in the pool at once; past that, or when the pool takes longer than
+``PASSWORD_HASHING_TIMEOUT`` seconds, the password is hashed inline.
+
+The hashes are plain ``pbkdf2_sha256`` ones, so hashers can be swapped
+without rehashing anybody.
+
+``CalibratedPBKDF2PasswordHasher`` uses the iteration count that
+"manage.py calibrate_hasher" measured on this host and wrote to
+``PASSWORD_HASHING_ITERATIONS_FILE``. Passwords hashed with another count
+are rehashed in the background when their users log in.
+"""
+import base64
+import hashlib
+import multiprocessing
+import os
+import threading
+
+from django.conf import settings
+from django.contrib.auth.hashers import PBKDF2PasswordHasher, get_hasher, make_password
+from django.utils.crypto import pbkdf2
+from django.utils.encoding import force_bytes
+
+from core.db.write_queue import serialized
+from core.metrics import Counter
+from core.tasks import defer
+
+HASHES = Counter('accounts_password_hashes_total', 'PBKDF2 hashes by where they ran.')
+
+_lock = threading.Lock()
+_pool = None
+_pool_pid = None
+_slots = None
+_iterations = {}
+
+
+def _pbkdf2(password, salt, iterations, digest_name):
+    return pbkdf2(password, salt, iterations, digest=getattr(hashlib, digest_name))
+
+
+def _get_pool():
+    """
+    The pool of the current process, started on first use.
+    """
+    global _pool, _pool_pid, _slots
+    if _pool_pid != os.getpid():
+        with _lock:
+            if _pool_pid != os.getpid():
+                processes = getattr(settings, 'PASSWORD_HASHING_PROCESSES', None) or multiprocessing.cpu_count()
+                _slots = threading.BoundedSemaphore(getattr(settings, 'PASSWORD_HASHING_QUEUE_SIZE', 2 * processes))
+                _pool = multiprocessing.Pool(processes)
+                _pool_pid = os.getpid()
+    return _pool, _slots
+
+
+class PooledPBKDF2PasswordHasher(PBKDF2PasswordHasher):
+    def pbkdf2(self, password, salt, iterations):
+        args = (force_bytes(password), force_bytes(salt), iterations, self.digest().name.lower())
+        pool, slots = _get_pool()
+        if not slots.acquire(False):
+            HASHES.inc(where='saturated')
+            return _pbkdf2(*args)
+        # The slot is given back once the pool is done, even if we stopped waiting.
+        result = pool.apply_async(_pbkdf2, args, callback=lambda hash: slots.release())
+        try:
+            hash = result.get(getattr(settings, 'PASSWORD_HASHING_TIMEOUT', 1.0))
+        except multiprocessing.TimeoutError:
+            HASHES.inc(where='timeout')
+            return _pbkdf2(*args)
+        HASHES.inc(where='pool')
+        return hash
+
+    def encode(self, password, salt, iterations=None):
+        assert password
+        assert salt and '$' not in salt
+        if not iterations:
+            iterations = self.iterations
+        hash = self.pbkdf2(password, salt, iterations)
+        hash = base64.b64encode(hash).decode('ascii').strip()
+        return "%s$%d$%s$%s" % (self.algorithm, iterations, salt, hash)
+
+
+def calibrated_iterations(default):
+    """
+    The iteration count in ``PASSWORD_HASHING_ITERATIONS_FILE``, read once per process.
+    """
+    path = getattr(settings, 'PASSWORD_HASHING_ITERATIONS_FILE', None)
+    if path not in _iterations:
+        try:
+            with open(path) as f:
+                _iterations[path] = int(f.read().strip())
+        except (TypeError, IOError, ValueError):
+            _iterations[path] = default
+    return _iterations[path]
+
+
+class CalibratedPBKDF2PasswordHasher(PooledPBKDF2PasswordHasher):
+    @property
+    def iterations(self):
+        return calibrated_iterations(PooledPBKDF2PasswordHasher.iterations)
+
+
+def must_update(encoded):
+    """
+    Whether ``encoded`` wasn't hashed by the preferred hasher, or with fewer iterations than it now uses.
+
+    Hashes with more iterations are kept: rolling back a calibration shouldn't weaken them.
+    """
+    hasher = get_hasher()
+    algorithm = encoded.split('$', 1)[0]
+    if algorithm != hasher.algorithm:
+        return True
+    if isinstance(hasher, PBKDF2PasswordHasher):
+        return int(encoded.split('$', 2)[1]) < hasher.iterations
+    return False
+
+
+def rehash_password(user, raw_password):
+    """
+    Rehash the password of ``user``, who just logged in with ``raw_password``, in the background.
+
+    The new hash is only saved if the password didn't change meanwhile.
+    """
+    manager = type(user)._default_manager.db_manager(user._state.db)
+    defer(user._state.db, _rehash, manager, user._state.db, user.pk, user.password, raw_password)
+
+
+def _rehash(manager, alias, pk, encoded, raw_password):
+    serialized(alias, manager.filter(pk=pk, password=encoded).update, password=make_password(raw_password))
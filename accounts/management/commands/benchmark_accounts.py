@@ -0,0 +1,124 @@
+import time
+from optparse import make_option
+
+from django.conf import settings
+from django.core.management.base import NoArgsCommand, CommandError
+from django.core.urlresolvers import reverse
+from django.test.client import Client
+
+from accounts.forms import UserCreationForm
+from accounts.models import User
+from core.benchmark import compare, load_results, run_workers, save_results, summarize, throwaway_database
+from core.metrics import DB_QUERY_SECONDS, REGISTRY
+
+SCENARIOS = ('register', 'activate', 'login', 'profile')
+
+
+def query_count():
+    """
+    Queries run so far by every thread of the process, including the database writer and the background tasks.
+    """
+    return sum(sum(value[0]) for name, labels, value in REGISTRY.snapshot() if name == DB_QUERY_SECONDS.name)
+
+
+def measure(samples, scenario, expected_status, request, *args, **kwargs):
+    queries = query_count()
+    start = time.time()
+    try:
+        response = request(*args, **kwargs)
+    except Exception:
+        ok = False
+    else:
+        ok = response.status_code == expected_status
+    # Deferred writes count towards the request during which they finish, if any.
+    samples[scenario].append((time.time() - start, query_count() - queries, ok))
+    return ok
+
+
+def run_flows(worker, users):
+    """
+    Take ``users`` new users through register, activate, login and profile.
+    """
+    samples = dict((scenario, []) for scenario in SCENARIOS)
+    for i in range(users):
+        client = Client(SERVER_NAME='localhost')
+        email = 'benchmark-%d-%d@example.com' % (worker, i)
+        data = {'email': email, 'password1': 'secret', 'password2': 'secret', 'tos': 'on'}
+        if not measure(samples, 'register', 302, client.post, reverse('registration_register'), data):
+            continue
+
+        activation_key = User.objects.get(email=email).activation_key
+        if not measure(samples, 'activate', 302, client.get,
+                       reverse('registration_activate', kwargs={'activation_key': activation_key})):
+            continue
+
+        client.logout()
+        if not measure(samples, 'login', 302, client.post, reverse('auth_login'),
+                       {'username': email, 'password': 'secret'}):
+            continue
+
+        measure(samples, 'profile', 200, client.get, settings.LOGIN_REDIRECT_URL)
+    return samples
+
+
+class Command(NoArgsCommand):
+    help = ("Benchmarks the register, activate, login and profile views with concurrent processes "
+            "against a throwaway database and the locmem email backend.")
+
+    option_list = NoArgsCommand.option_list + (
+        make_option('--concurrency', dest='concurrency', type='int', default=4,
+                    help='Number of worker processes.'),
+        make_option('--users', dest='users', type='int', default=50,
+                    help='Number of users each worker takes through the flow.'),
+        make_option('--output', dest='output', default=None,
+                    help='Write the results as JSON to this file.'),
+        make_option('--baseline', dest='baseline', default=None,
+                    help='Fail if any scenario regressed against the results in this file.'),
+        make_option('--threshold', dest='threshold', type='float', default=0.2,
+                    help='Tolerated p95 and throughput regression, as a fraction. Defaults to 0.2.'),
+    )
+
+    def handle_noargs(self, **options):
+        concurrency = options['concurrency']
+        settings.DEBUG = False
+        settings.EMAIL_BACKEND = 'django.core.mail.backends.locmem.EmailBackend'
+        # Verifying a captcha means a round trip to Google; keep it out of the numbers.
+        UserCreationForm.base_fields.pop('captcha', None)
+
+        with throwaway_database():
+            start = time.time()
+            results = run_workers(run_flows, concurrency, options['users'])
+            elapsed = time.time() - start
+
+        scenarios = {}
+        for scenario in SCENARIOS:
+            samples = [sample for result in results for sample in result[scenario]]
+            scenarios[scenario] = summarize([latency for latency, queries, ok in samples if ok],
+                                            workers=concurrency,
+                                            queries=[queries for latency, queries, ok in samples if ok],
+                                            errors=len([ok for latency, queries, ok in samples if not ok]))
+
+        report = {
+            'concurrency': concurrency,
+            'users': concurrency * options['users'],
+            'elapsed': elapsed,
+            'flows_per_second': scenarios['profile']['requests'] / elapsed,
+            'scenarios': scenarios,
+        }
+
+        for scenario in SCENARIOS:
+            summary = scenarios[scenario]
+            self.stdout.write('%-10s %6d ok %4d errors %8.1f req/s  p50 %7.1fms  p95 %7.1fms  p99 %7.1fms  '
+                              '%5.1f queries' % (scenario, summary['requests'], summary['errors'],
+                                                 summary['throughput'], (summary['p50'] or 0) * 1000,
+                                                 (summary['p95'] or 0) * 1000, (summary['p99'] or 0) * 1000,
+                                                 summary['queries_per_request']))
+        self.stdout.write('%.1f complete flows/s' % report['flows_per_second'])
+
+        if options['output']:
+            save_results(options['output'], report)
+
+        if options['baseline']:
+            regressions = compare(report, load_results(options['baseline']), options['threshold'])
+            if regressions:
+                raise CommandError('Regressed against %s:\n%s' % (options['baseline'], '\n'.join(regressions)))
@@ -0,0 +1,72 @@
+import threading
+import time
+from optparse import make_option
+
+from django.conf import settings
+from django.core.management.base import NoArgsCommand
+from django.core.urlresolvers import reverse
+from django.db import connection
+from django.test.client import Client
+from django.test.utils import override_settings
+
+from accounts.models import User
+from core.benchmark import summarize, throwaway_database
+
+HASHERS = (
+    ('inline', 'django.contrib.auth.hashers.PBKDF2PasswordHasher'),
+    ('pooled', 'accounts.hashers.PooledPBKDF2PasswordHasher'),
+)
+
+
+def log_in(emails, logins, samples):
+    try:
+        client = Client(SERVER_NAME='localhost')
+        for i in range(logins):
+            email = emails[i % len(emails)]
+            start = time.time()
+            response = client.post(reverse('auth_login'), {'username': email, 'password': 'secret'})
+            samples.append((time.time() - start, response.status_code == 302))
+            client.logout()
+    finally:
+        connection.close()
+
+
+class Command(NoArgsCommand):
+    help = ("Measures logins per second through the login view from concurrent threads of one process, hashing "
+            "passwords inline and in the process pool, against a throwaway database.")
+
+    option_list = NoArgsCommand.option_list + (
+        make_option('--threads', dest='threads', type='int', default=8,
+                    help='Number of threads logging in, like a threaded server.'),
+        make_option('--logins', dest='logins', type='int', default=20,
+                    help='Number of logins per thread.'),
+        make_option('--users', dest='users', type='int', default=20,
+                    help='Number of users to log in as.'),
+    )
+
+    def handle_noargs(self, **options):
+        settings.DEBUG = False
+
+        with throwaway_database():
+            emails = ['login-%d@example.com' % i for i in range(options['users'])]
+            for email in emails:
+                User.objects.create_user(email, 'secret')
+            connection.close()
+
+            for name, hasher in HASHERS:
+                samples = []
+                threads = [threading.Thread(target=log_in, args=(emails, options['logins'], samples))
+                           for i in range(options['threads'])]
+                with override_settings(PASSWORD_HASHERS=(hasher,)):
+                    start = time.time()
+                    for thread in threads:
+                        thread.start()
+                    for thread in threads:
+                        thread.join()
+                    elapsed = time.time() - start
+
+                ok = [latency for latency, succeeded in samples if succeeded]
+                summary = summarize(ok, errors=len(samples) - len(ok))
+                self.stdout.write('%-7s %5d logins %4d errors %8.1f logins/s  p50 %7.1fms  p99 %7.1fms' % (
+                    name, summary['requests'], summary['errors'], summary['requests'] / elapsed,
+                    (summary['p50'] or 0) * 1000, (summary['p99'] or 0) * 1000))
@@ -0,0 +1,50 @@
+import time
+from optparse import make_option
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management.base import NoArgsCommand
+from django.core.urlresolvers import reverse
+from django.test.client import Client
+
+from core.benchmark import run_workers, summarize
+
+MODES = ('rendered', 'cached')
+
+
+def get_register_page(worker, requests, mode):
+    url = reverse('registration_register')
+    latencies = []
+    errors = 0
+    for i in range(requests):
+        if mode == 'rendered':
+            cache.clear()
+        client = Client(SERVER_NAME='localhost')
+        start = time.time()
+        response = client.get(url)
+        latencies.append(time.time() - start)
+        errors += response.status_code != 200
+    return latencies, errors
+
+
+class Command(NoArgsCommand):
+    help = ("Measures the anonymous GETs of the registration page per second, rendering the form every time "
+            "and serving it from the cache.")
+
+    option_list = NoArgsCommand.option_list + (
+        make_option('--concurrency', dest='concurrency', type='int', default=1,
+                    help='Number of worker processes.'),
+        make_option('--requests', dest='requests', type='int', default=500,
+                    help='Number of requests per worker and mode.'),
+    )
+
+    def handle_noargs(self, **options):
+        settings.DEBUG = False
+        for mode in MODES:
+            results = run_workers(get_register_page, options['concurrency'], options['requests'], mode)
+            summary = summarize([latency for latencies, errors in results for latency in latencies],
+                                workers=options['concurrency'],
+                                errors=sum(errors for latencies, errors in results))
+            self.stdout.write('%-9s %6d ok %4d errors %8.1f renders/s  p50 %6.2fms  p99 %6.2fms' % (
+                mode, summary['requests'], summary['errors'], summary['throughput'],
+                (summary['p50'] or 0) * 1000, (summary['p99'] or 0) * 1000))
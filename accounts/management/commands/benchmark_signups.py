@@ -0,0 +1,74 @@
+import threading
+import time
+from optparse import make_option
+
+from django.conf import settings
+from django.core.management.base import NoArgsCommand
+from django.db import connection
+
+from accounts.models import User
+from core.benchmark import run_workers, summarize, throwaway_database
+
+
+def sign_up(worker, threads, signups, password):
+    """
+    Create ``signups`` inactive users from each of ``threads`` threads.
+    """
+    samples = []
+
+    def run(thread):
+        try:
+            for i in range(signups):
+                email = 'signup-%d-%d-%d@example.com' % (worker, thread, i)
+                start = time.time()
+                try:
+                    User.objects.create_inactive_user(email, password, send_email=False)
+                except Exception:
+                    ok = False
+                else:
+                    ok = True
+                samples.append((time.time() - start, ok))
+        finally:
+            connection.close()
+
+    pool = [threading.Thread(target=run, args=(thread,)) for thread in range(threads)]
+    for thread in pool:
+        thread.start()
+    for thread in pool:
+        thread.join()
+    return samples
+
+
+class Command(NoArgsCommand):
+    help = ("Measures how many signups per second concurrent processes and threads get through against a "
+            "throwaway database, with the database writes serialized per process or not.")
+
+    option_list = NoArgsCommand.option_list + (
+        make_option('--workers', dest='workers', type='int', default=4,
+                    help='Number of worker processes.'),
+        make_option('--threads', dest='threads', type='int', default=4,
+                    help='Number of threads per worker process.'),
+        make_option('--signups', dest='signups', type='int', default=50,
+                    help='Number of signups per thread.'),
+        make_option('--no-serialize', dest='serialize', action='store_false', default=True,
+                    help='Let every thread write to the database itself.'),
+        make_option('--skip-hashing', dest='skip_hashing', action='store_true', default=False,
+                    help='Give the users unusable passwords, to measure the database alone.'),
+    )
+
+    def handle_noargs(self, **options):
+        settings.DEBUG = False
+        settings.SERIALIZE_DB_WRITES = options['serialize']
+        password = None if options['skip_hashing'] else 'secret'
+
+        with throwaway_database():
+            start = time.time()
+            results = run_workers(sign_up, options['workers'], options['threads'], options['signups'], password)
+            elapsed = time.time() - start
+
+        samples = [sample for result in results for sample in result]
+        ok = [latency for latency, succeeded in samples if succeeded]
+        summary = summarize(ok, errors=len(samples) - len(ok))
+        self.stdout.write('%d signups, %d errors in %.1fs: %.1f signups/s  p50 %.1fms  p99 %.1fms' % (
+            summary['requests'], summary['errors'], elapsed, summary['requests'] / elapsed,
+            (summary['p50'] or 0) * 1000, (summary['p99'] or 0) * 1000))
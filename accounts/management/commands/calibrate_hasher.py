@@ -0,0 +1,50 @@
+import os
+import time
+from optparse import make_option
+
+from django.conf import settings
+from django.core.management.base import NoArgsCommand, CommandError
+from django.utils.crypto import pbkdf2
+
+SAMPLE_ITERATIONS = 10000
+
+
+class Command(NoArgsCommand):
+    help = ("Measures PBKDF2 on this host and writes the iteration count hashing a password within --budget "
+            "milliseconds to PASSWORD_HASHING_ITERATIONS_FILE, for CalibratedPBKDF2PasswordHasher.")
+
+    option_list = NoArgsCommand.option_list + (
+        make_option('--budget', dest='budget', type='float', default=100.0,
+                    help='Milliseconds a hash may take. Defaults to 100.'),
+        make_option('--min-iterations', dest='min_iterations', type='int', default=10000,
+                    help='Never write fewer iterations than this, whatever the budget. Defaults to 10000.'),
+        make_option('--samples', dest='samples', type='int', default=5,
+                    help='Number of hashes timed.'),
+        make_option('--dry-run', dest='dry_run', action='store_true', default=False,
+                    help='Only print the iteration count.'),
+    )
+
+    def handle_noargs(self, **options):
+        path = getattr(settings, 'PASSWORD_HASHING_ITERATIONS_FILE', None)
+        if not path and not options['dry_run']:
+            raise CommandError("PASSWORD_HASHING_ITERATIONS_FILE isn't set.")
+
+        timings = []
+        for i in range(options['samples']):
+            start = time.time()
+            pbkdf2('calibration', 'salt', SAMPLE_ITERATIONS)
+            timings.append(time.time() - start)
+        per_iteration = sorted(timings)[len(timings) // 2] / SAMPLE_ITERATIONS
+
+        iterations = int(options['budget'] / 1000 / per_iteration) // 1000 * 1000
+        if iterations < options['min_iterations']:
+            self.stderr.write('A hash takes %.0fms with the minimum of %d iterations, over the budget.' % (
+                options['min_iterations'] * per_iteration * 1000, options['min_iterations']))
+            iterations = options['min_iterations']
+        self.stdout.write('%d iterations, %.0fms per hash' % (iterations, iterations * per_iteration * 1000))
+
+        if not options['dry_run']:
+            tmp_path = '%s.tmp' % path
+            with open(tmp_path, 'w') as f:
+                f.write('%d\n' % iterations)
+            os.rename(tmp_path, path)
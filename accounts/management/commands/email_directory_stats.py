@@ -0,0 +1,50 @@
+import random
+import time
+from optparse import make_option
+
+from django.core.management.base import NoArgsCommand
+
+from accounts.directory import EmailDirectory, get_directory
+from accounts.sharding import user_shards
+from core.benchmark import summarize
+
+
+class Command(NoArgsCommand):
+    help = ("Reports the size of the in-memory email directories and how fast prefix lookups are, per shard "
+            "or for --synthetic users.")
+
+    option_list = NoArgsCommand.option_list + (
+        make_option('--synthetic', dest='synthetic', type='int', default=0,
+                    help='Measure a directory of this many made up users instead of the real ones.'),
+        make_option('--lookups', dest='lookups', type='int', default=10000,
+                    help='Number of prefix lookups timed.'),
+    )
+
+    def handle_noargs(self, **options):
+        if options['synthetic']:
+            directory = EmailDirectory('synthetic')
+            start = time.time()
+            directory.emails = sorted('user.%07d@example%d.com' % (i, i % 100) for i in range(options['synthetic']))
+            directory.pks.extend(range(1, options['synthetic'] + 1))
+            directory.active.extend([1] * options['synthetic'])
+            self.report(directory, time.time() - start, options['lookups'])
+        else:
+            for alias in user_shards():
+                start = time.time()
+                self.report(get_directory(alias), time.time() - start, options['lookups'])
+
+    def report(self, directory, build_seconds, lookups):
+        users = len(directory)
+        memory = directory.memory()
+        latencies = []
+        for i in range(lookups if users else 0):
+            prefix = directory.emails[random.randrange(users)][:random.randint(1, 8)].decode('utf-8')
+            start = time.time()
+            directory.search(prefix, 20)
+            latencies.append(time.time() - start)
+        summary = summarize(latencies)
+        # Bytes per user are megabytes per million users.
+        self.stdout.write('%s: %d users, %.1f MB, %.0f MB per million users, built in %.2fs' % (
+            directory.alias, users, memory / 1e6, users and float(memory) / users or 0, build_seconds))
+        self.stdout.write('%s: lookups p50 %.1fus  p99 %.1fus' % (
+            directory.alias, (summary['p50'] or 0) * 1e6, (summary['p99'] or 0) * 1e6))
@@ -0,0 +1,66 @@
+from optparse import make_option
+
+from django.core.management.base import NoArgsCommand, CommandError
+from django.db import transaction
+
+from accounts.models import User
+from accounts.sharding import shard_for_email, user_shards
+
+
+def move_users(users, source, target):
+    """
+    Copy ``users`` from ``source`` to ``target``, then delete them from ``source``.
+
+    Users already on ``target``, copied by an interrupted run, are only
+    deleted, so running it again is safe.
+    """
+    emails = [user.email for user in users]
+    existing = set(User.objects.using(target).filter(email__in=emails).values_list('email', flat=True))
+    with transaction.commit_on_success(using=target):
+        for user in users:
+            if user.email in existing:
+                continue
+            group_ids = list(user.groups.values_list('pk', flat=True))
+            permission_ids = list(user.user_permissions.values_list('pk', flat=True))
+            user.pk = None
+            user.save(using=target, force_insert=True)
+            user.groups.add(*group_ids)
+            user.user_permissions.add(*permission_ids)
+    with transaction.commit_on_success(using=source):
+        User.objects.using(source).filter(email__in=emails).delete()
+
+
+class Command(NoArgsCommand):
+    help = "Moves the users that aren't on the shard their email hashes to, in batches."
+
+    option_list = NoArgsCommand.option_list + (
+        make_option('--batch-size', dest='batch_size', type='int', default=500,
+                    help='Users read, and moved, per batch.'),
+        make_option('--dry-run', dest='dry_run', action='store_true', default=False,
+                    help='Only count the users that would move.'),
+    )
+
+    def handle_noargs(self, **options):
+        if len(user_shards()) < 2:
+            raise CommandError("USER_SHARDS lists a single shard.")
+
+        for source in user_shards():
+            moved = 0
+            last_pk = 0
+            while True:
+                batch = list(User.objects.using(source).filter(pk__gt=last_pk).order_by('pk')[:options['batch_size']])
+                if not batch:
+                    break
+                last_pk = batch[-1].pk
+
+                misplaced = {}
+                for user in batch:
+                    target = shard_for_email(user.email)
+                    if target != source:
+                        misplaced.setdefault(target, []).append(user)
+                for target, users in misplaced.items():
+                    if not options['dry_run']:
+                        move_users(users, source, target)
+                    moved += len(users)
+
+            self.stdout.write('%s: %d users %s' % (source, moved, options['dry_run'] and 'to move' or 'moved'))
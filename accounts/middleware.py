@@ -0,0 +1,32 @@
+from django.contrib import auth
+from django.contrib.auth.middleware import AuthenticationMiddleware
+from django.contrib.auth.models import AnonymousUser
+from django.utils.functional import SimpleLazyObject
+
+from accounts.sharding import SHARD_SESSION_KEY, is_sharded, user_shards
+
+
+def get_user(request):
+    if not hasattr(request, '_cached_user'):
+        shard = request.session.get(SHARD_SESSION_KEY)
+        if not is_sharded() or shard not in user_shards():
+            request._cached_user = auth.get_user(request)
+        else:
+            user_model = auth.get_user_model()
+            try:
+                user = user_model._default_manager.db_manager(shard).get(pk=request.session[auth.SESSION_KEY])
+                user.backend = request.session[auth.BACKEND_SESSION_KEY]
+            except (KeyError, user_model.DoesNotExist):
+                user = AnonymousUser()
+            request._cached_user = user
+    return request._cached_user
+
+
+class ShardedAuthenticationMiddleware(AuthenticationMiddleware):
+    """
+    ``AuthenticationMiddleware`` loading the user from the shard recorded in the session.
+    """
+
+    def process_request(self, request):
+        super(ShardedAuthenticationMiddleware, self).process_request(request)
+        request.user = SimpleLazyObject(lambda: get_user(request))
@@ -2,53 +2,72 @@ import hashlib
 import random
 import re
 import datetime
-from django.db import models
+from django.db import models, router
 from django.contrib.sites.models import Site
 from django.utils.translation import ugettext_lazy as _
 from django.utils import timezone
 from django.utils.http import urlquote
 from django.core.mail import send_mail, EmailMultiAlternatives
-from django.contrib.auth.models import BaseUserManager, AbstractBaseUser, PermissionsMixin
+from django.contrib.auth.models import (BaseUserManager, AbstractBaseUser, PermissionsMixin,
+                                        update_last_login as auth_update_last_login)
+from django.contrib.auth.signals import user_logged_in
 from django.conf import settings
 from django.template.loader import render_to_string
+from accounts.sharding import (encode_activation_key, is_sharded, remember_shard, shard_for_activation_key,
+                               shard_for_email, shards_starting_with)
+from core.db.write_queue import serialized
+from core.metrics import Counter, Histogram
 
 SHA1_RE = re.compile('^[a-f0-9]{40}$')
 
+REGISTRATION_SECONDS = Histogram('accounts_registration_seconds', 'Time spent creating inactive users.')
+ACTIVATIONS = Counter('accounts_activations_total', 'Activation attempts by outcome.')
+ACTIVATION_SECONDS = Histogram('accounts_activation_seconds', 'Time spent activating users.')
+PASSWORD_HASH_SECONDS = Histogram('accounts_password_hash_seconds', 'Time spent hashing and checking passwords.')
+EMAIL_RENDER_SECONDS = Histogram('accounts_email_render_seconds', 'Time spent rendering activation emails.')
+EMAIL_SEND_SECONDS = Histogram('accounts_email_send_seconds', 'Time spent sending activation emails.')
+
 
 class UserManager(BaseUserManager):
-    def create_user(self, email, password=None, **extra_fields):
+    def _build_user(self, email, password, is_staff, is_superuser, is_active=True, **extra_fields):
         now = timezone.now()
         if not email:
             raise ValueError(_('Users must have an email address'))
 
         user = self.model(
             email=UserManager.normalize_email(email),
-            is_staff=False, is_active=True, is_superuser=False,
+            is_staff=is_staff, is_active=is_active, is_superuser=is_superuser,
             last_login=now, date_joined=now, **extra_fields
         )
 
         user.set_password(password)
-        user.save(using=self._db)
         return user
 
-    def create_superuser(self, email, password, **extra_fields):
-        user = self.create_user(email, password=password, **extra_fields)
-        user.is_staff = True
-        user.is_active = True
-        user.is_superuser = True
-        user.save(using=self._db)
+    def _create_user(self, email, password, is_staff, is_superuser, is_active=True, **extra_fields):
+        user = self._build_user(email, password, is_staff, is_superuser, is_active, **extra_fields)
+        self._save(user)
         return user
 
-    def create_inactive_user(self, email, password, send_email=True, **extra_fields):
-        user = self.create_user(email, password, **extra_fields)
-        user.is_active = False
+    def create_user(self, email, password=None, **extra_fields):
+        return self._create_user(email, password, False, False, **extra_fields)
 
+    def create_superuser(self, email, password, **extra_fields):
+        return self._create_user(email, password, True, True, **extra_fields)
+
+    def build_inactive_user(self, email, password, **extra_fields):
+        """
+        An unsaved inactive user with a fresh activation key.
+        """
         salt = hashlib.sha1(str(random.random())).hexdigest()[:5]
-        if isinstance(email, unicode):
-            email = email.encode('utf-8')
-        user.activation_key = hashlib.sha1(salt + email).hexdigest()
+        raw_email = email.encode('utf-8') if isinstance(email, unicode) else email
+        activation_key = encode_activation_key(hashlib.sha1(salt + raw_email).hexdigest(), raw_email)
+        return self._build_user(email, password, False, False, is_active=False,
+                                activation_key=activation_key, **extra_fields)
 
-        user.save(using=self._db)
+    @REGISTRATION_SECONDS.time()
+    def create_inactive_user(self, email, password, send_email=True, **extra_fields):
+        user = self.build_inactive_user(email, password, **extra_fields)
+        self._save(user)
 
         if send_email:
             site = Site.objects.get_current()
@@ -56,34 +75,67 @@ class UserManager(BaseUserManager):
 
         return user
 
+    @ACTIVATION_SECONDS.time()
     def activate_user(self, activation_key):
         if SHA1_RE.search(activation_key):
             try:
-                user = self.get(activation_key=activation_key)
+                user = self.get_on_shards(shard_for_activation_key(activation_key), activation_key=activation_key)
             except self.model.DoesNotExist:
+                ACTIVATIONS.inc(outcome='unknown')
                 return False
             if not user.activation_key_expired():
                 user.is_active = True
                 user.activation_key = self.model.ACTIVATED
-                user.save()
+                self._save(user)
+                ACTIVATIONS.inc(outcome='activated')
                 return user
+            ACTIVATIONS.inc(outcome='expired')
+            return False
+        ACTIVATIONS.inc(outcome='malformed')
         return False
 
-    def send_activation_email(self, user, site):
+    def _save(self, user):
+        # Hashing the password and rendering emails stay out of the writer thread.
+        using = self._db or router.db_for_write(self.model, instance=user)
+        serialized(using, user.save, using=using)
+
+    def get_by_natural_key(self, email):
+        return self.get_on_shards(shard_for_email(email), email=email)
+
+    def get_on_shards(self, shard, **kwargs):
+        """
+        ``get()`` looking on ``shard`` first, then on the other shards.
+        """
+        if not is_sharded():
+            return self.get(**kwargs)
+        for alias in shards_starting_with(shard):
+            try:
+                return self.db_manager(alias).get(**kwargs)
+            except self.model.DoesNotExist:
+                continue
+        raise self.model.DoesNotExist("User matching query does not exist. Lookup parameters were %s" % kwargs)
+
+    def activation_email(self, user, site):
         ctx_dict = {'activation_key': user.activation_key,
                     'expiration_days': settings.ACCOUNT_ACTIVATION_DAYS,
                     'site': site,
                     'static_url': settings.STATIC_URL}
 
-        subject = render_to_string('accounts/activation_email_subject.txt', ctx_dict)
-        subject = ''.join(subject.splitlines())
+        with EMAIL_RENDER_SECONDS.time():
+            subject = render_to_string('accounts/activation_email_subject.txt', ctx_dict)
+            subject = ''.join(subject.splitlines())
 
-        message_text = render_to_string('accounts/activation_email.txt', ctx_dict)
-        message_html = render_to_string('accounts/activation_email.html', ctx_dict)
+            message_text = render_to_string('accounts/activation_email.txt', ctx_dict)
+            message_html = render_to_string('accounts/activation_email.html', ctx_dict)
 
         msg = EmailMultiAlternatives(subject, message_text, settings.DEFAULT_FROM_EMAIL, [user.email])
         msg.attach_alternative(message_html, "text/html")
-        msg.send()
+        return msg
+
+    def send_activation_email(self, user, site):
+        msg = self.activation_email(user, site)
+        with EMAIL_SEND_SECONDS.time():
+            msg.send()
 
 
 class User(AbstractBaseUser, PermissionsMixin):
@@ -109,12 +161,53 @@ class User(AbstractBaseUser, PermissionsMixin):
         verbose_name = _('user')
         verbose_name_plural = _('users')
 
+    def __init__(self, *args, **kwargs):
+        super(User, self).__init__(*args, **kwargs)
+        self._loaded_values = self._field_values()
+
+    def _field_values(self):
+        # Deferred fields aren't in __dict__ until they are loaded.
+        return dict((field.attname, self.__dict__[field.attname])
+                    for field in self._meta.fields if field.attname in self.__dict__)
+
+    def changed_fields(self):
+        """
+        Names of the fields assigned a different value since the user was loaded or saved.
+        """
+        loaded = self._loaded_values
+        return [field.name for field in self._meta.fields
+                if not field.primary_key and field.attname in self.__dict__ and
+                (field.attname not in loaded or loaded[field.attname] != self.__dict__[field.attname])]
+
+    def save(self, force_insert=False, force_update=False, using=None, update_fields=None):
+        """
+        Only UPDATE the changed fields of users saved to the database they were loaded from.
+        """
+        if (update_fields is None and not force_insert and not self._state.adding and
+                self.pk is not None and (using or self._state.db) == self._state.db):
+            update_fields = self.changed_fields()
+        super(User, self).save(force_insert=force_insert, force_update=force_update, using=using,
+                               update_fields=update_fields)
+        values = self._field_values()
+        if update_fields is not None:
+            saved = set(self._meta.get_field(name).attname for name in update_fields)
+            values = dict((attname, value) for attname, value in values.items() if attname in saved)
+        self._loaded_values.update(values)
+
     def get_absolute_url(self):
         return "/users/%s/" % urlquote(self.email)
 
     def email_user(self, subject, message, from_email=None):
         send_mail(subject, message, from_email, [self.email])
 
+    def set_password(self, raw_password):
+        with PASSWORD_HASH_SECONDS.time(operation='set'):
+            super(User, self).set_password(raw_password)
+
+    def check_password(self, raw_password):
+        with PASSWORD_HASH_SECONDS.time(operation='check'):
+            return super(User, self).check_password(raw_password)
+
     def get_full_name(self):
         if self.first_name and self.last_name:
             full_name = '%s %s' % (self.first_name, self.last_name)
@@ -143,3 +236,12 @@ class User(AbstractBaseUser, PermissionsMixin):
 
     def __unicode__(self):
         return self.email
+
+
+
+def update_last_login(sender, user, **kwargs):
+    serialized(router.db_for_write(type(user), instance=user), auth_update_last_login, sender, user, **kwargs)
+
+user_logged_in.disconnect(auth_update_last_login)
+user_logged_in.connect(update_last_login)
+user_logged_in.connect(remember_shard)
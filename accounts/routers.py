@@ -0,0 +1,114 @@
+"""
+Database routing for the accounts and auth tables.
+
+``ShardRouter`` keeps the users, and the rows hanging off them, on their
+shard (see ``accounts.sharding``). List it first: the writes it routes pin
+the client's reads like those going through ``ReplicaRouter``.
+
+With ``ReplicaRouter``, reads go to one of the ``DATABASE_REPLICAS`` and writes to the primary.
+Once a client has written (registered, activated, logged in, changed its
+password...) its reads stay on the primary for ``REPLICA_PIN_SECONDS``, so
+it never sees a replica that hasn't caught up with its own write yet.
+"""
+import random
+import threading
+import time
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+
+from accounts.sharding import current_shard, is_sharded, shard_for_email
+
+ROUTED_APPS = ('accounts', 'auth')
+
+_state = threading.local()
+
+
+def replicas():
+    return getattr(settings, 'DATABASE_REPLICAS', ())
+
+
+def pin_cookie_name():
+    return getattr(settings, 'REPLICA_PIN_COOKIE_NAME', 'primary_until')
+
+
+def is_pinned():
+    return getattr(_state, 'pinned', False) or getattr(_state, 'wrote', False)
+
+
+class ShardRouter(object):
+    def _instance_db(self, model, hints):
+        if not is_sharded() or model._meta.app_label != 'accounts':
+            return None
+        instance = hints.get('instance')
+        if instance is None:
+            return current_shard()
+        if instance._state.db is None and hasattr(instance, 'email'):
+            return shard_for_email(instance.email)
+        return instance._state.db
+
+    def db_for_read(self, model, **hints):
+        return self._instance_db(model, hints)
+
+    def db_for_write(self, model, **hints):
+        db = self._instance_db(model, hints)
+        if db is not None:
+            # ReplicaRouter isn't asked: pin the client's reads for it.
+            _state.wrote = True
+        return db
+
+    def allow_relation(self, obj1, obj2, **hints):
+        labels = set((obj1._meta.app_label, obj2._meta.app_label))
+        if not is_sharded() or 'accounts' not in labels:
+            return None
+        # Groups and permissions are the same on every shard.
+        return 'auth' in labels or obj1._state.db == obj2._state.db
+
+
+class ReplicaRouter(object):
+    def db_for_read(self, model, **hints):
+        if model._meta.app_label not in ROUTED_APPS or not replicas():
+            return None
+        if is_pinned():
+            return DEFAULT_DB_ALIAS
+        return random.choice(replicas())
+
+    def db_for_write(self, model, **hints):
+        if model._meta.app_label in ROUTED_APPS:
+            _state.wrote = True
+            return DEFAULT_DB_ALIAS
+        return None
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = (DEFAULT_DB_ALIAS,) + tuple(replicas())
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_syncdb(self, db, model):
+        # Replicas get their tables from the primary.
+        if db in replicas():
+            return False
+        return None
+
+
+class ReplicaPinningMiddleware(object):
+    """
+    Pin the reads of clients that just wrote to the primary, through a cookie.
+
+    Put it before the session and authentication middleware.
+    """
+
+    def process_request(self, request):
+        _state.wrote = False
+        try:
+            _state.pinned = float(request.COOKIES.get(pin_cookie_name(), 0)) > time.time()
+        except ValueError:
+            _state.pinned = False
+
+    def process_response(self, request, response):
+        if getattr(_state, 'wrote', False):
+            seconds = getattr(settings, 'REPLICA_PIN_SECONDS', 5)
+            response.set_cookie(pin_cookie_name(), str(time.time() + seconds), max_age=seconds, httponly=True)
+        _state.wrote = _state.pinned = False
+        return response
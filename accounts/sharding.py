@@ -0,0 +1,137 @@
+"""
+Horizontal sharding of the users by a hash of their normalized email.
+
+``USER_SHARDS`` lists the database aliases holding users, each with the
+accounts and auth tables; groups and permissions must be the same on all of
+them. With a single shard (the default) none of this changes anything.
+
+A user lives on the shard its email hashes to. Activation keys carry the
+shard in their first two hex digits and the session remembers the shard of
+the logged-in user, since primary keys are only unique within a shard: log
+users in with ``login`` below, which starts a new session when the previous
+user came from another shard.
+Queries that don't go through ``UserManager`` or an instance only see the
+first shard, unless run within ``on_shard``. Password reset tokens carry the
+shard like activation keys, since the reset links only carry a pk.
+"""
+import hashlib
+import threading
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.contrib import auth
+from django.contrib.auth.tokens import PasswordResetTokenGenerator
+from django.db import DEFAULT_DB_ALIAS
+
+SHARD_SESSION_KEY = '_auth_user_shard'
+
+_state = threading.local()
+
+
+def user_shards():
+    return tuple(getattr(settings, 'USER_SHARDS', (DEFAULT_DB_ALIAS,)))
+
+
+def is_sharded():
+    return len(user_shards()) > 1
+
+
+def shard_index_for_email(email):
+    from accounts.models import UserManager
+    email = UserManager.normalize_email(email)
+    if isinstance(email, unicode):
+        email = email.encode('utf-8')
+    return int(hashlib.md5(email).hexdigest()[:8], 16) % len(user_shards())
+
+
+def shard_for_email(email):
+    return user_shards()[shard_index_for_email(email)]
+
+
+def encode_activation_key(activation_key, email):
+    """
+    Make the first two hex digits of ``activation_key`` name the shard of ``email``.
+    """
+    return '%02x%s' % (shard_index_for_email(email), activation_key[2:])
+
+
+def shard_for_activation_key(activation_key):
+    shards = user_shards()
+    try:
+        return shards[int(activation_key[:2], 16)]
+    except (ValueError, IndexError):
+        return shards[0]
+
+
+class ShardPasswordResetTokenGenerator(PasswordResetTokenGenerator):
+    """
+    Password reset tokens whose first two hex digits name the user's shard when sharded.
+
+    Strip them with ``split_reset_token`` before checking the token.
+    """
+
+    def make_token(self, user):
+        token = super(ShardPasswordResetTokenGenerator, self).make_token(user)
+        if is_sharded():
+            token = '%02x%s' % (user_shards().index(user._state.db), token)
+        return token
+
+
+reset_token_generator = ShardPasswordResetTokenGenerator()
+
+
+def split_reset_token(token):
+    """
+    The shard named by a ``ShardPasswordResetTokenGenerator`` token, and the token to check.
+    """
+    if not is_sharded():
+        return user_shards()[0], token
+    return shard_for_activation_key(token), token[2:]
+
+
+@contextmanager
+def on_shard(alias):
+    """
+    Route the queries of the users that don't carry an instance, e.g. ``User.objects.get(pk=...)``, to ``alias``.
+    """
+    previous = current_shard()
+    _state.shard = alias
+    try:
+        yield
+    finally:
+        _state.shard = previous
+
+
+def current_shard():
+    return getattr(_state, 'shard', None)
+
+
+def shards_starting_with(alias):
+    """
+    All the shards, ``alias`` first: users stay on their old shard until rebalanced.
+    """
+    return (alias,) + tuple(shard for shard in user_shards() if shard != alias)
+
+
+def remember_shard(sender, request, user, **kwargs):
+    """
+    Record the shard of the user logging in, for ``ShardedAuthenticationMiddleware``.
+    """
+    if is_sharded():
+        request.session[SHARD_SESSION_KEY] = user._state.db
+
+
+def flush_other_shard(request, user):
+    """
+    Start a new session when ``user`` isn't on the shard of the user logged in.
+
+    ``django.contrib.auth.login`` only compares the primary keys, which repeat across shards.
+    """
+    if is_sharded() and auth.SESSION_KEY in request.session \
+            and request.session.get(SHARD_SESSION_KEY) != user._state.db:
+        request.session.flush()
+
+
+def login(request, user):
+    flush_other_shard(request, user)
+    auth.login(request, user)
@@ -1,12 +1,41 @@
+import base64
 import datetime
+import json
+import os
+import re
+import tempfile
+import time
+from StringIO import StringIO
 
 from django.core.urlresolvers import reverse
 from django.core import mail
+from django.core.cache import cache
+from django.db import connection
+from django.http import HttpResponse
 from django.test import TestCase
+from django.test.client import Client, RequestFactory
 from django.conf import settings
+from django.core.management import call_command
+from django.contrib.auth.hashers import check_password, make_password
 
-from accounts.forms import UserCreationForm
-from accounts.models import User
+from accounts import directory
+from accounts.forms import AdminUserCreationForm, UserCreationForm
+from accounts.models import SHA1_RE, User
+from accounts.routers import ReplicaPinningMiddleware, ReplicaRouter
+from accounts.sharding import (SHARD_SESSION_KEY, encode_activation_key, shard_for_activation_key,
+                               shard_for_email)
+from accounts.views import _iter_json_values
+from core.tasks import TASKS
+
+
+def emails_by_shard():
+    """
+    An email hashing to each of the ``USER_SHARDS``, ``{shard: email}``.
+    """
+    emails = {}
+    for i in range(20):
+        emails.setdefault(shard_for_email('user%d@bar.com' % i), 'user%d@bar.com' % i)
+    return emails
 
 
 class RegistrationTests(TestCase):
@@ -17,6 +46,9 @@ class RegistrationTests(TestCase):
     urls = 'accounts.test_urls'
     ACTIVATED = u"ALREADY_ACTIVATED"
 
+    def setUp(self):
+        cache.clear()
+
     def create_user(self):
         return self.client.post(reverse('registration_register'),
                                 data={'email': 'foofoo@barbar.com',
@@ -33,6 +65,17 @@ class RegistrationTests(TestCase):
         self.assertTemplateUsed(response, 'accounts/registration_form.html')
         self.assertTrue(isinstance(response.context['form'], UserCreationForm))
 
+    def test_registration_view_cached(self):
+        """
+        Serve the blank form from the cache, with the CSRF token of each visitor.
+        """
+        self.client.get(reverse('registration_register'))
+
+        response = Client().get(reverse('registration_register'))
+        self.assertEqual(response.status_code, 200)
+        self.assertIsNone(response.context)
+        self.assertContains(response, "value='%s'" % response.cookies[settings.CSRF_COOKIE_NAME].value)
+
     def test_registration_view_success(self):
         """
         Register a new user.
@@ -142,3 +185,333 @@ class RegistrationTests(TestCase):
         user = User.objects.get(email='foofoo@barbar.com')
         response = self.client.get(reverse('registration_test_activate_success_url', kwargs={'activation_key' : user.activation_key}))
         self.assertRedirects(response, reverse('registration_register'))
+
+
+class PasswordResetTests(TestCase):
+    """
+    Test the password reset views.
+    """
+
+    multi_db = True
+
+    def reset(self, email):
+        response = self.client.post(reverse('auth_password_reset'), {'email': email})
+        self.assertEqual(response['Location'], 'http://testserver%s' % reverse('auth_password_reset_done'))
+        link = re.search(r'https?://[^/]+(/\S+)', mail.outbox[-1].body).group(1)
+
+        response = self.client.post(link, {'new_password1': 'new', 'new_password2': 'new'})
+        self.assertEqual(response['Location'], 'http://testserver%s' % reverse('auth_password_reset_complete'))
+        self.assertTrue(self.client.login(username=email, password='new'))
+
+    def test_password_reset(self):
+        User.objects.create_user('foo@bar.com', 'secret')
+        self.reset('foo@bar.com')
+
+    def test_password_reset_on_shard(self):
+        with self.settings(USER_SHARDS=('default', 'shard1')):
+            emails = emails_by_shard()
+            for email in emails.values():
+                User.objects.create_user(email, 'secret')
+            self.reset(emails['shard1'])
+            self.assertTrue(User.objects.using('default').get(email=emails['default']).check_password('secret'))
+
+
+class ReplicaRouterTests(TestCase):
+    """
+    Test the read-replica routing and the pinning of writers to the primary.
+    """
+
+    def setUp(self):
+        self.router = ReplicaRouter()
+        self.middleware = ReplicaPinningMiddleware()
+        self.factory = RequestFactory()
+
+    def test_reads_go_to_replicas(self):
+        with self.settings(DATABASE_REPLICAS=('replica',)):
+            self.middleware.process_request(self.factory.get('/'))
+            self.assertEqual(self.router.db_for_read(User), 'replica')
+            self.assertEqual(self.router.db_for_write(User), 'default')
+            self.assertEqual(self.router.db_for_read(User), 'default')
+            response = self.middleware.process_response(self.factory.get('/'), HttpResponse())
+
+        self.assertIn(settings.REPLICA_PIN_COOKIE_NAME, response.cookies)
+
+    def test_pinned_client_reads_from_primary(self):
+        request = self.factory.get('/')
+        request.COOKIES[settings.REPLICA_PIN_COOKIE_NAME] = str(time.time() + 60)
+        with self.settings(DATABASE_REPLICAS=('replica',)):
+            self.middleware.process_request(request)
+            self.assertEqual(self.router.db_for_read(User), 'default')
+            response = self.middleware.process_response(request, HttpResponse())
+            self.assertNotIn(settings.REPLICA_PIN_COOKIE_NAME, response.cookies)
+
+            self.middleware.process_request(self.factory.get('/'))
+            self.assertEqual(self.router.db_for_read(User), 'replica')
+
+
+class ShardingTests(TestCase):
+    """
+    Test the routing of the users to their shard, and the shard lookups.
+    """
+
+    multi_db = True
+
+    def test_users_on_their_shard(self):
+        with self.settings(USER_SHARDS=('default', 'shard1')):
+            for shard, email in emails_by_shard().items():
+                user = User.objects.create_inactive_user(email, 'secret', send_email=False)
+                self.assertEqual(user._state.db, shard)
+                self.assertEqual(list(User.objects.using(shard).values_list('email', flat=True)), [email])
+                self.assertEqual(shard_for_activation_key(user.activation_key), shard)
+
+                user = User.objects.activate_user(user.activation_key)
+                self.assertTrue(User.objects.using(shard).get(email=email).is_active)
+                self.assertEqual(User.objects.get_by_natural_key(email), user)
+                self.assertEqual(User.objects.get_by_natural_key(email)._state.db, shard)
+
+    def test_duplicate_signup(self):
+        with self.settings(USER_SHARDS=('default', 'shard1')):
+            email = emails_by_shard()['shard1']
+            User.objects.create_user(email, 'secret')
+            for form_class in (UserCreationForm, AdminUserCreationForm):
+                form = form_class(data={'email': email, 'password1': 'secret', 'password2': 'secret', 'tos': 'on'})
+                self.assertEqual(form.errors.keys(), ['email'])
+
+    def test_rebalance(self):
+        with self.settings(USER_SHARDS=('default', 'shard1')):
+            emails = emails_by_shard()
+        for email in emails.values():
+            User.objects.create_user(email, 'secret')
+
+        with self.settings(USER_SHARDS=('default', 'shard1')):
+            email = emails['shard1']
+            # Found on its old shard until moved.
+            self.assertEqual(User.objects.get_by_natural_key(email)._state.db, 'default')
+
+            stdout = StringIO()
+            call_command('rebalance_shards', stdout=stdout)
+            self.assertEqual(stdout.getvalue().splitlines(), ['default: 1 users moved', 'shard1: 0 users moved'])
+            self.assertEqual(User.objects.get_by_natural_key(email)._state.db, 'shard1')
+            self.assertFalse(User.objects.using('default').filter(email=email).exists())
+            self.assertTrue(User.objects.get_by_natural_key(email).check_password('secret'))
+
+    def test_shard_writes_pin_reads(self):
+        middleware = ReplicaPinningMiddleware()
+        with self.settings(USER_SHARDS=('default', 'shard1'), DATABASE_REPLICAS=('replica',)):
+            middleware.process_request(RequestFactory().get('/'))
+            User.objects.create_user(emails_by_shard()['shard1'], 'secret')
+            response = middleware.process_response(RequestFactory().get('/'), HttpResponse())
+        self.assertIn(settings.REPLICA_PIN_COOKIE_NAME, response.cookies)
+
+    def test_activation_key_names_shard(self):
+        with self.settings(USER_SHARDS=('default', 'shard1', 'shard2')):
+            for email in ('foo@bar.com', 'bar@foo.com', 'baz@foo.com'):
+                activation_key = encode_activation_key('a' * 40, email)
+                self.assertTrue(SHA1_RE.search(activation_key))
+                self.assertEqual(shard_for_activation_key(activation_key), shard_for_email(email))
+
+    def test_single_shard(self):
+        user = User.objects.create_inactive_user('foo@bar.com', 'secret', send_email=False)
+        self.assertEqual(shard_for_activation_key(user.activation_key), 'default')
+        self.assertEqual(User.objects.get_by_natural_key('foo@bar.com'), user)
+
+    def test_login_flushes_session_of_other_shard(self):
+        """
+        The same primary key on another shard is another user: the session starts over.
+        """
+        with self.settings(USER_SHARDS=('default', 'shard1')):
+            emails = emails_by_shard()
+            users = dict((shard, User.objects.create_user(email, 'secret')) for shard, email in emails.items())
+            self.assertEqual(users['default'].pk, users['shard1'].pk)
+
+            for shard, kept in (('default', True), ('shard1', False)):
+                self.client.post(reverse('auth_login'), {'username': emails['default'], 'password': 'secret'})
+                session = self.client.session
+                session['foo'] = 'bar'
+                session.save()
+                response = self.client.post(reverse('auth_login'), {'username': emails[shard], 'password': 'secret'})
+                self.assertEqual(response.status_code, 302)
+                self.assertEqual('foo' in self.client.session, kept)
+                self.assertEqual(self.client.session[SHARD_SESSION_KEY], shard)
+                self.assertEqual(self.client.get(settings.LOGIN_REDIRECT_URL).context['user'].email, emails[shard])
+
+
+class DirtyFieldsTests(TestCase):
+    """
+    Test that saving a user only writes what changed.
+    """
+
+    def test_create_inactive_user_single_insert(self):
+        self.assertNumQueries(1, User.objects.create_inactive_user, 'foo@bar.com', 'secret', send_email=False)
+
+    def test_save_updates_changed_fields(self):
+        User.objects.create_user('foo@bar.com', 'secret')
+        user = User.objects.get(email='foo@bar.com')
+        self.assertNumQueries(0, user.save)
+
+        user.first_name = 'Foo'
+        connection.use_debug_cursor = True
+        try:
+            start = len(connection.queries)
+            user.save()
+            queries = [query['sql'] for query in connection.queries[start:]]
+        finally:
+            connection.use_debug_cursor = False
+
+        self.assertEqual(len(queries), 1)
+        self.assertIn('"first_name"', queries[0])
+        self.assertNotIn('"password"', queries[0])
+        self.assertEqual(User.objects.get(email='foo@bar.com').first_name, 'Foo')
+
+
+class PooledHasherTests(TestCase):
+    """
+    Test the PBKDF2 hasher running in a process pool.
+    """
+
+    def test_compatible_with_pbkdf2(self):
+        with self.settings(PASSWORD_HASHERS=('accounts.hashers.PooledPBKDF2PasswordHasher',)):
+            encoded = make_password('secret')
+        self.assertTrue(encoded.startswith('pbkdf2_sha256$'))
+        with self.settings(PASSWORD_HASHERS=('django.contrib.auth.hashers.PBKDF2PasswordHasher',)):
+            self.assertTrue(check_password('secret', encoded))
+            self.assertFalse(check_password('wrong', encoded))
+
+
+class CalibratedHasherTests(TestCase):
+    """
+    Test the rehash of passwords hashed with fewer iterations on login.
+    """
+
+    def setUp(self):
+        self.paths = []
+
+    def tearDown(self):
+        for path in self.paths:
+            os.remove(path)
+
+    def iterations_file(self, iterations):
+        handle, path = tempfile.mkstemp()
+        os.write(handle, '%d\n' % iterations)
+        os.close(handle)
+        self.paths.append(path)
+        return path
+
+    def login(self):
+        response = self.client.post(reverse('auth_login'), {'username': 'foo@bar.com', 'password': 'secret'})
+        self.assertEqual(response.status_code, 302)
+        return User.objects.get(email='foo@bar.com').password
+
+    def test_rehash_on_login(self):
+        with self.settings(PASSWORD_HASHING_ITERATIONS_FILE=None):
+            User.objects.create_user('foo@bar.com', 'secret')
+        self.assertTrue(User.objects.get(email='foo@bar.com').password.startswith('pbkdf2_sha256$10000$'))
+
+        with self.settings(PASSWORD_HASHING_ITERATIONS_FILE=self.iterations_file(12000)):
+            self.assertTrue(self.login().startswith('pbkdf2_sha256$12000$'))
+            self.assertTrue(User.objects.get(email='foo@bar.com').check_password('secret'))
+
+    def test_no_rehash_with_fewer_iterations(self):
+        with self.settings(PASSWORD_HASHING_ITERATIONS_FILE=self.iterations_file(12000)):
+            User.objects.create_user('foo@bar.com', 'secret')
+
+        with self.settings(PASSWORD_HASHING_ITERATIONS_FILE=self.iterations_file(11000)):
+            self.assertTrue(self.login().startswith('pbkdf2_sha256$12000$'))
+
+
+class BulkRegisterTests(TestCase):
+    """
+    Test the bulk registration API.
+    """
+
+    def setUp(self):
+        User.objects.create_superuser('admin@bar.com', 'secret')
+        self.auth = 'Basic %s' % base64.b64encode('admin@bar.com:secret')
+
+    def post(self, body, **extra):
+        return self.client.post(reverse('registration_bulk_register'), body,
+                                content_type='application/x-ndjson', **extra)
+
+    def test_requires_permission(self):
+        User.objects.create_user('foo@bar.com', 'secret')
+        self.assertEqual(self.post('[]').status_code, 401)
+        response = self.post('[]', HTTP_AUTHORIZATION='Basic %s' % base64.b64encode('foo@bar.com:secret'))
+        self.assertEqual(response.status_code, 401)
+
+    def test_streams_results(self):
+        rows = [
+            {'email': 'new@bar.com', 'password': 'secret', 'tos': True},
+            {'email': 'new@bar.com', 'password': 'secret', 'tos': True},
+            {'email': 'admin@bar.com', 'password': 'secret', 'tos': True},
+            {'email': 'not an email', 'password': 'secret', 'tos': True},
+        ]
+        with self.settings(BULK_REGISTER_CHUNK_SIZE=3):
+            response = self.post('\n'.join(json.dumps(row) for row in rows) + '\n{"email"',
+                                 HTTP_AUTHORIZATION=self.auth)
+            self.assertEqual(response.status_code, 200)
+            results = [json.loads(line) for line in ''.join(response.streaming_content).splitlines()]
+
+        self.assertEqual([(result['row'], result['status']) for result in results],
+                         [(0, 'created'), (1, 'invalid'), (2, 'invalid'), (3, 'invalid'), (4, 'malformed')])
+        self.assertEqual(results[3]['errors'].keys(), ['email'])
+        self.assertFalse(User.objects.get(email='new@bar.com').is_active)
+
+        TASKS.join()
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].to, ['new@bar.com'])
+
+    def test_json_array(self):
+        for read_size in (1, 1024):
+            values = lambda body: list(_iter_json_values(StringIO(body), read_size))
+            self.assertEqual(values(' [1, {"a": [2]} ,\n"b"] \n'), [1, {'a': [2]}, 'b'])
+            self.assertEqual(values('[ ]'), [])
+            self.assertEqual(values('1\n[2]\n'), [1, [2]])
+            for body in ('[1,,2]', '[1 2]', '[1,]', '[,1]', '[1] 2', '[1]]', '[1'):
+                self.assertRaises(ValueError, values, body)
+
+
+class EmailDirectoryTests(TestCase):
+    """
+    Test the in-memory email directory and the admin autocomplete it serves.
+    """
+
+    def setUp(self):
+        directory._directories.clear()
+        User.objects.create_superuser('admin@bar.com', 'secret')
+
+    def test_search(self):
+        User.objects.create_inactive_user('Foo@bar.com', 'secret', send_email=False)
+        self.assertEqual([email for email, pk, is_active in directory.search('a')], ['admin@bar.com'])
+
+        # Saves and deletes in this process show up right away.
+        user = User.objects.create_user('food@bar.com', 'secret')
+        self.assertEqual([(email, is_active) for email, pk, is_active in directory.search('FOO')],
+                         [('foo@bar.com', False), ('food@bar.com', True)])
+        user.email = 'bar@bar.com'
+        user.save()
+        self.assertEqual(len(directory.search('foo')), 1)
+        user.delete()
+        self.assertEqual(directory.search('bar'), [])
+
+        # Users created behind its back show up once it is refreshed.
+        User.objects.bulk_create([User(email='baz@bar.com')])
+        with self.settings(EMAIL_DIRECTORY_REFRESH_INTERVAL=0):
+            self.assertEqual(len(directory.search('baz')), 1)
+
+    def test_new_users_not_looked_up_by_pk(self):
+        email_directory = directory.get_directory('default')
+        removed = []
+        email_directory.remove = removed.append
+        user = User.objects.create_user('foo@bar.com', 'secret')
+        self.assertEqual(removed, [])
+        self.assertEqual(len(email_directory.search('foo', 10)), 1)
+
+        user.email = 'bar@bar.com'
+        user.save()
+        self.assertEqual(removed, [user.pk])
+
+    def test_autocomplete(self):
+        self.client.login(username='admin@bar.com', password='secret')
+        response = self.client.get(reverse('admin:accounts_user_autocomplete'), {'q': 'adm'})
+        self.assertEqual(json.loads(response.content),
+                         [{'email': 'admin@bar.com', 'pk': User.objects.get().pk, 'is_active': True}])
@@ -1,40 +1,55 @@
 from django.conf.urls import patterns, url
+from django.core.urlresolvers import reverse_lazy
+from django.contrib.auth import views as auth_views
 from django.views.generic import TemplateView
-from accounts.forms import UserAuthenticationForm
-from accounts.views import register, activate, profile
+from accounts.forms import UserPasswordResetForm
+from accounts.sharding import reset_token_generator
+from accounts.views import register, activate, bulk_register, log_in, password_reset_confirm, profile
+from core.cache import cache_anonymous
+from core.metrics import timed_view
 
 urlpatterns = patterns('',
                        url(r'^activate/complete/$',
-                           TemplateView.as_view(template_name="accounts/activation_complete.html"),
+                           cache_anonymous(TemplateView.as_view(template_name="accounts/activation_complete.html")),
                            name='registration_activation_complete'),
                        # Activation keys get matched by \w+ instead of the more specific
                        # [a-fA-F0-9]{40} because a bad activation key should still get to the view;
                        # that way it can return a sensible "invalid key" message instead of a confusing 404.
-                       url(r'^activate/(?P<activation_key>\w+)/$', activate, name='registration_activate'),
-                       url(r'^register/$', register, name='registration_register'),
+                       url(r'^activate/(?P<activation_key>\w+)/$', timed_view(activate, 'activate'),
+                           name='registration_activate'),
+                       url(r'^register/$', timed_view(register, 'register'), name='registration_register'),
+                       url(r'^register/bulk/$', timed_view(bulk_register, 'bulk_register'),
+                           name='registration_bulk_register'),
                        url(r'^register/complete/$',
-                           TemplateView.as_view(template_name="accounts/registration_complete.html"),
+                           cache_anonymous(TemplateView.as_view(template_name="accounts/registration_complete.html")),
                            name='registration_complete'),
 
                        # Auth urls
-                       url(r'^login/$', 'django.contrib.auth.views.login',
-                           {'template_name': 'accounts/login.html',
-                            'authentication_form': UserAuthenticationForm}, name='auth_login'),
-                       url(r'^logout/$', 'django.contrib.auth.views.logout', name='auth_logout'),
-                       url(r'^password/change/$', 'django.contrib.auth.views.password_change',
+                       url(r'^login/$', timed_view(log_in, 'login'),
+                           {'template_name': 'accounts/login.html'}, name='auth_login'),
+                       url(r'^logout/$', timed_view(auth_views.logout, 'logout'), name='auth_logout'),
+                       # The timed views can't be reversed by their dotted path, as the auth views do by default.
+                       url(r'^password/change/$', timed_view(auth_views.password_change, 'password_change'),
+                           {'post_change_redirect': reverse_lazy('auth_password_change_done')},
                            name='auth_password_change'),
-                       url(r'^password/change/done/$', 'django.contrib.auth.views.password_change_done',
+                       url(r'^password/change/done/$',
+                           timed_view(auth_views.password_change_done, 'password_change_done'),
                            name='auth_password_change_done'),
-                       url(r'^password/reset/$', 'django.contrib.auth.views.password_reset',
+                       url(r'^password/reset/$', timed_view(auth_views.password_reset, 'password_reset'),
+                           {'post_reset_redirect': reverse_lazy('auth_password_reset_done'),
+                            'email_template_name': 'accounts/password_reset_email.html',
+                            'password_reset_form': UserPasswordResetForm,
+                            'token_generator': reset_token_generator},
                            name='auth_password_reset'),
-                       url(r'^password/reset/done/$', 'django.contrib.auth.views.password_reset_done',
+                       url(r'^password/reset/done/$', timed_view(auth_views.password_reset_done, 'password_reset_done'),
                            name='auth_password_reset_done'),
                        url(r'^reset/(?P<uidb36>[0-9A-Za-z]{1,13})-(?P<token>[0-9A-Za-z]{1,13}-[0-9A-Za-z]{1,20})/$',
-                           'django.contrib.auth.views.password_reset_confirm',
+                           timed_view(password_reset_confirm, 'password_reset_confirm'),
+                           {'post_reset_redirect': reverse_lazy('auth_password_reset_complete')},
                            name='auth_password_reset_confirm'),
-                       url(r'^reset/done/$', 'django.contrib.auth.views.password_reset_complete',
+                       url(r'^reset/done/$', timed_view(auth_views.password_reset_complete, 'password_reset_complete'),
                            name='auth_password_reset_complete'),
 
                        # Profile
                        url(r'^profile/$', profile),
-)
\ No newline at end of file
+)
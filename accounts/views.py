@@ -1,11 +1,25 @@
-from accounts.forms import UserCreationForm
+import base64
+import codecs
+import json
+
+from accounts.forms import BulkUserCreationForm, UserAuthenticationForm, UserCreationForm
 from accounts.models import User
+from accounts.sharding import flush_other_shard, login, on_shard, shard_for_email, split_reset_token
 from django.template import RequestContext
 from django.shortcuts import redirect
 from django.shortcuts import render_to_response
-from django.contrib.auth import login
+from django.contrib.auth import authenticate
+from django.contrib.auth import views as auth_views
+from django.contrib.sites.models import Site
 from django.conf import settings
+from django.core.mail import get_connection
+from django.db import IntegrityError
+from django.http import HttpResponse, HttpResponseNotAllowed, StreamingHttpResponse
+from django.views.decorators.csrf import csrf_exempt
 from accounts import signals
+from core.cache import cached_render, is_anonymous
+from core.db.write_queue import serialized
+from core.tasks import defer
 
 
 def register(request, success_url='registration_complete',
@@ -24,6 +38,10 @@ def register(request, success_url='registration_complete',
                                          user=new_user,
                                          request=request)
             return redirect(success_url)
+    elif not extra_context and is_anonymous(request):
+        # The blank form only depends on the fields the settings add.
+        variant = 'tos=%s,captcha=%s' % (getattr(settings, 'ADD_TOS', False), getattr(settings, 'ADD_RECAPTCHA', False))
+        return cached_render(request, template_name, lambda: {'form': UserCreationForm()}, variant)
     else:
         form = UserCreationForm()
 
@@ -38,6 +56,30 @@ def register(request, success_url='registration_complete',
                               context_instance=context)
 
 
+def log_in(request, authentication_form=UserAuthenticationForm, **kwargs):
+    """
+    ``django.contrib.auth.views.login``, starting a new session for a user of another shard.
+    """
+
+    class ShardAuthenticationForm(authentication_form):
+        def clean(self):
+            cleaned_data = super(ShardAuthenticationForm, self).clean()
+            if self.get_user() is not None:
+                flush_other_shard(request, self.get_user())
+            return cleaned_data
+
+    return auth_views.login(request, authentication_form=ShardAuthenticationForm, **kwargs)
+
+
+def password_reset_confirm(request, uidb36=None, token=None, **kwargs):
+    """
+    ``django.contrib.auth.views.password_reset_confirm`` looking the user up on the shard named by the token.
+    """
+    shard, token = split_reset_token(token)
+    with on_shard(shard):
+        return auth_views.password_reset_confirm(request, uidb36, token, **kwargs)
+
+
 def activate(request, activation_key, template_name='accounts/activate.html',
              success_url=None, extra_context=None, **kwargs):
     """
@@ -74,3 +116,196 @@ def profile(request):
         'accounts/profile.html',
         context_instance=RequestContext(request)
     )
+
+
+@csrf_exempt
+def bulk_register(request):
+    """
+    Register the users of a JSON array, or newline-delimited JSON, of registrations.
+
+    Each registration holds the fields of ``UserCreationForm``, with
+    ``password`` standing for both passwords if given. The caller logs in
+    with HTTP Basic authentication and needs the permission to add users.
+    The response streams a JSON line per registration, in order.
+    """
+    if request.method != 'POST':
+        return HttpResponseNotAllowed(['POST'])
+
+    user = _basic_auth_user(request)
+    if user is None or not user.has_perm('accounts.add_user'):
+        response = HttpResponse(status=401)
+        response['WWW-Authenticate'] = 'Basic realm="accounts"'
+        return response
+
+    return StreamingHttpResponse(_bulk_register(request, Site.objects.get_current()),
+                                 content_type='application/x-ndjson')
+
+
+def _basic_auth_user(request):
+    try:
+        method, credentials = request.META['HTTP_AUTHORIZATION'].split(' ', 1)
+        email, password = base64.b64decode(credentials.strip()).decode('utf-8').split(':', 1)
+    except (KeyError, ValueError, TypeError):
+        return None
+    if method.lower() != 'basic':
+        return None
+    user = authenticate(username=email, password=password)
+    if user is None or not user.is_active:
+        return None
+    return user
+
+
+def _iter_json_values(stream, read_size=64 * 1024):
+    """
+    Yield the values of the JSON array, or newline-delimited JSON, read from ``stream`` as they come.
+
+    Raises ValueError on malformed input.
+    """
+    decoder = json.JSONDecoder()
+    utf8 = codecs.getincrementaldecoder('utf-8')()
+    buf, pos, eof, array = u'', 0, False, None
+    # In an array, what comes next: 'first' (a value or "]"), 'value', 'separator' ("," or "]") or 'end'.
+    expect = None
+    while True:
+        while pos < len(buf) and buf[pos].isspace():
+            pos += 1
+
+        if pos < len(buf):
+            if array is None:
+                array = buf[pos] == '['
+                if array:
+                    pos += 1
+                    expect = 'first'
+                continue
+            if array:
+                if expect == 'end':
+                    raise ValueError('Extra data after the array')
+                if buf[pos] == ']' and expect in ('first', 'separator'):
+                    pos += 1
+                    expect = 'end'
+                    continue
+                if expect == 'separator':
+                    if buf[pos] != ',':
+                        raise ValueError('Expected "," or "]" between the items of the array')
+                    pos += 1
+                    expect = 'value'
+                    continue
+                if buf[pos] in ',]':
+                    raise ValueError('Expected an item of the array')
+            try:
+                value, end = decoder.raw_decode(buf, pos)
+            except ValueError:
+                if eof:
+                    raise
+            else:
+                # A number ending the buffer may go on in the next read.
+                if end < len(buf) or eof:
+                    pos = end
+                    expect = 'separator'
+                    yield value
+                    continue
+        elif eof:
+            if array and expect != 'end':
+                raise ValueError('Unterminated array')
+            return
+
+        data = stream.read(read_size)
+        eof = not data
+        buf, pos = buf[pos:] + utf8.decode(data, eof), 0
+
+
+def _bulk_register(request, site):
+    chunk_size = getattr(settings, 'BULK_REGISTER_CHUNK_SIZE', 100)
+    records = _iter_json_values(request)
+    row = 0
+    while True:
+        chunk, error = [], None
+        try:
+            for record in records:
+                chunk.append(record)
+                if len(chunk) == chunk_size:
+                    break
+        except ValueError as e:
+            error = e
+
+        for result in _register_chunk(request, chunk, row, site):
+            yield json.dumps(result) + '\n'
+        row += len(chunk)
+
+        if error is not None:
+            yield json.dumps({'row': row, 'status': 'malformed', 'error': unicode(error)}) + '\n'
+            return
+        if len(chunk) < chunk_size:
+            return
+
+
+def _register_chunk(request, chunk, first_row, site):
+    """
+    Validate and insert a chunk of registrations; returns their results.
+    """
+    results = [{'row': first_row + i} for i in range(len(chunk))]
+    forms = {}
+    for i, record in enumerate(chunk):
+        if not isinstance(record, dict):
+            results[i].update(status='invalid', errors={'__all__': ['Expected an object.']})
+            continue
+        if 'password' in record:
+            record = dict(record, password1=record['password'], password2=record['password'])
+        form = BulkUserCreationForm(data=record)
+        if form.is_valid():
+            forms[i] = form
+        else:
+            results[i].update(status='invalid', errors=dict((field, [unicode(error) for error in errors])
+                                                            for field, errors in form.errors.items()))
+
+    # One query per shard for the whole chunk, rather than one per registration.
+    emails = {}
+    for i, form in sorted(forms.items()):
+        email = User.objects.normalize_email(form.cleaned_data['email'])
+        emails.setdefault(shard_for_email(email), {}).setdefault(email, []).append(i)
+    existing = set()
+    for alias, indexes in emails.items():
+        existing.update(User.objects.db_manager(alias).filter(email__in=indexes.keys())
+                        .values_list('email', flat=True))
+
+    users = {}
+    for alias, indexes in emails.items():
+        for email, rows in indexes.items():
+            if email not in existing:
+                i = rows.pop(0)
+                users.setdefault(alias, []).append(
+                    (i, User.objects.build_inactive_user(email, forms[i].cleaned_data['password1'])))
+            for i in rows:
+                _set_duplicate(results[i], email)
+
+    created = []
+    for alias, rows in users.items():
+        try:
+            serialized(alias, User.objects.db_manager(alias).bulk_create, [user for i, user in rows])
+            saved = rows
+        except IntegrityError:
+            # Registered meanwhile: insert one by one to tell which.
+            saved = []
+            for i, user in rows:
+                try:
+                    serialized(alias, user.save, using=alias, force_insert=True)
+                    saved.append((i, user))
+                except IntegrityError:
+                    _set_duplicate(results[i], user.email)
+        for i, user in saved:
+            results[i].update(email=user.email, status='created')
+            signals.user_registered.send(sender=User, user=user, request=request)
+            created.append(user)
+
+    if created:
+        defer(None, _send_activation_emails, created, site)
+    return results
+
+
+def _set_duplicate(result, email):
+    result.update(email=email, status='invalid',
+                  errors={'email': [unicode(User(email=email).unique_error_message(User, ('email',)))]})
+
+
+def _send_activation_emails(users, site):
+    get_connection().send_messages([User.objects.activation_email(user, site) for user in users])
@@ -0,0 +1,131 @@
+"""
+Helpers shared by the benchmark management commands.
+"""
+import json
+import math
+import multiprocessing
+import os
+import tempfile
+from contextlib import contextmanager
+
+from django.db import connections
+
+
+def percentile(values, fraction):
+    """
+    Nearest-rank percentile of the already sorted ``values``.
+    """
+    if not values:
+        return None
+    return values[max(int(math.ceil(fraction * len(values))) - 1, 0)]
+
+
+def summarize(latencies, workers=1, queries=None, errors=0):
+    """
+    Summarize the latencies, in seconds, of one scenario.
+
+    ``throughput`` is the number of operations per second the ``workers``
+    would sustain doing nothing else.
+    """
+    latencies = sorted(latencies)
+    busy = sum(latencies)
+    summary = {
+        'requests': len(latencies),
+        'errors': errors,
+        'throughput': busy and workers * len(latencies) / busy or 0.0,
+        'p50': percentile(latencies, .50),
+        'p95': percentile(latencies, .95),
+        'p99': percentile(latencies, .99),
+    }
+    if queries is not None:
+        summary['queries_per_request'] = latencies and float(sum(queries)) / len(latencies) or 0.0
+    return summary
+
+
+def run_workers(target, count, *args):
+    """
+    Run ``target(worker_number, *args)`` in ``count`` processes and return their results.
+
+    The database connections are closed first so no child inherits one.
+    """
+    for connection in connections.all():
+        connection.close()
+
+    queue = multiprocessing.Queue()
+
+    def worker(number):
+        try:
+            queue.put((number, target(number, *args)))
+        except Exception as e:
+            queue.put((number, e))
+
+    processes = [multiprocessing.Process(target=worker, args=(number,)) for number in range(count)]
+    for process in processes:
+        process.start()
+    results = dict(queue.get() for process in processes)
+    for process in processes:
+        process.join()
+
+    failures = [result for result in results.values() if isinstance(result, Exception)]
+    if failures:
+        raise failures[0]
+    return [results[number] for number in range(count)]
+
+
+@contextmanager
+def throwaway_database(alias='default', verbosity=0):
+    """
+    Point ``alias`` at a freshly synced test database for the duration of the block.
+
+    SQLite gets a temporary file instead of ``:memory:`` so worker processes
+    can share it.
+    """
+    connection = connections[alias]
+    if connection.vendor == 'sqlite':
+        handle, path = tempfile.mkstemp(suffix='.db', prefix='benchmark-')
+        os.close(handle)
+        connection.settings_dict['TEST_NAME'] = path
+    old_name = connection.settings_dict['NAME']
+    connection.creation.create_test_db(verbosity=verbosity, autoclobber=True)
+    try:
+        yield connection
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=verbosity)
+
+
+def compare(results, baseline, threshold):
+    """
+    List the scenarios of ``results`` that regressed against ``baseline``.
+
+    A scenario regresses when its p95 grows or its throughput drops by more
+    than ``threshold`` (a fraction), or when it issues more queries, or when
+    none of its requests succeed any more. Scenarios without successful
+    requests in ``baseline`` have nothing to compare against.
+    """
+    regressions = []
+    for name, base in sorted(baseline['scenarios'].items()):
+        current = results['scenarios'].get(name)
+        if current is None or not base['requests']:
+            continue
+        if not current['requests']:
+            regressions.append('%s: no successful requests' % name)
+            continue
+        if current['p95'] > base['p95'] * (1 + threshold):
+            regressions.append('%s: p95 %.4fs > %.4fs' % (name, current['p95'], base['p95']))
+        if current['throughput'] < base['throughput'] * (1 - threshold):
+            regressions.append('%s: throughput %.1f/s < %.1f/s' % (name, current['throughput'],
+                                                                    base['throughput']))
+        if current.get('queries_per_request', 0) > base.get('queries_per_request', 0):
+            regressions.append('%s: %.2f queries per request > %.2f' % (name, current['queries_per_request'],
+                                                                         base['queries_per_request']))
+    return regressions
+
+
+def load_results(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_results(path, results):
+    with open(path, 'w') as f:
+        json.dump(results, f, indent=2, sort_keys=True)
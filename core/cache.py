@@ -0,0 +1,115 @@
+"""
+Caches for the pages every anonymous visitor sees identically.
+"""
+import hashlib
+import os
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse, HttpResponseNotModified
+from django.middleware.csrf import get_token
+from django.template import RequestContext
+from django.template.loader import render_to_string
+from django.template.loaders.app_directories import app_template_dirs
+from django.utils.cache import patch_vary_headers
+from django.utils.translation import get_language
+
+# Rendered in place of the CSRF token by cached_render, which swaps in the token of each request.
+CSRF_PLACEHOLDER = 'CSRFTOKENPLACEHOLDERb5f2c3a1'
+
+_template_version = None
+
+
+def template_version():
+    """
+    Hash of every template the project ships.
+
+    It changes whenever a deploy touches a template, which retires every
+    cached page rendered from the previous ones.
+    """
+    global _template_version
+    if _template_version is None:
+        digest = hashlib.md5()
+        for template_dir in tuple(settings.TEMPLATE_DIRS) + app_template_dirs:
+            for root, dirs, files in sorted(os.walk(template_dir)):
+                for name in sorted(files):
+                    path = os.path.join(root, name)
+                    digest.update(path.encode('utf-8'))
+                    with open(path, 'rb') as f:
+                        digest.update(f.read())
+        _template_version = digest.hexdigest()[:12]
+    return _template_version
+
+
+def is_anonymous(request):
+    # Without a session cookie there is no session to load and no user.
+    if settings.SESSION_COOKIE_NAME not in request.COOKIES:
+        return True
+    return not request.user.is_authenticated()
+
+
+def cache_anonymous(view):
+    """
+    Serve GETs of anonymous visitors from the cache, with a strong ETag.
+
+    Only 200 responses that didn't use the CSRF token are stored, keyed on
+    the path, the active language and the template version.
+    """
+
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if request.method not in ('GET', 'HEAD') or not is_anonymous(request):
+            return view(request, *args, **kwargs)
+
+        key = 'anonymous-page:%s:%s:%s' % (template_version(), get_language(),
+                                           hashlib.md5(request.path.encode('utf-8')).hexdigest())
+        cached = cache.get(key)
+        if cached is not None:
+            content, content_type, etag = cached
+            if etag in request.META.get('HTTP_IF_NONE_MATCH', ''):
+                response = HttpResponseNotModified()
+            else:
+                response = HttpResponse(content, content_type=content_type)
+            response['ETag'] = etag
+            patch_vary_headers(response, ('Cookie', 'Accept-Language'))
+            return response
+
+        def store(response):
+            if response.status_code == 200 and not request.META.get('CSRF_COOKIE_USED'):
+                etag = '"%s"' % hashlib.md5(response.content).hexdigest()
+                response['ETag'] = etag
+                cache.set(key, (response.content, response['Content-Type'], etag),
+                          getattr(settings, 'ANONYMOUS_CACHE_TIMEOUT', 600))
+            patch_vary_headers(response, ('Cookie', 'Accept-Language'))
+
+        response = view(request, *args, **kwargs)
+        if getattr(response, 'is_rendered', True):
+            store(response)
+        else:
+            response.add_post_render_callback(store)
+        return response
+
+    return wrapper
+
+
+def cached_render(request, template_name, get_dictionary, variant=''):
+    """
+    Render ``template_name`` for an anonymous visitor, from the cache when possible.
+
+    The page is rendered once per template, ``variant``, language and
+    template version with a placeholder for the CSRF token, which is
+    replaced by the token of the request on the way out.
+    ``get_dictionary`` returns the template variables, only needed to
+    render; they may only depend on what ``variant`` identifies.
+    """
+    key = 'anonymous-render:%s:%s:%s:%s' % (template_version(), get_language(), template_name, variant)
+    content = cache.get(key)
+    if content is None:
+        context = RequestContext(request, get_dictionary())
+        context['csrf_token'] = CSRF_PLACEHOLDER
+        content = render_to_string(template_name, context_instance=context)
+        cache.set(key, content, getattr(settings, 'ANONYMOUS_CACHE_TIMEOUT', 600))
+    response = HttpResponse(content.replace(CSRF_PLACEHOLDER, get_token(request)))
+    patch_vary_headers(response, ('Cookie', 'Accept-Language'))
+    return response
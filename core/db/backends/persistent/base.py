@@ -0,0 +1,150 @@
+"""
+Database backend that keeps connections open across requests.
+
+It wraps the backend named by the ``WRAPPED_ENGINE`` key of the database
+settings::
+
+    DATABASES = {
+        'default': {
+            'ENGINE': 'core.db.backends.persistent',
+            'WRAPPED_ENGINE': 'django.db.backends.postgresql_psycopg2',
+            'CONN_MAX_AGE': 600,
+            'CONN_HEALTH_CHECK_INTERVAL': 30,
+            'POOL_SIZE': 0,
+            ...
+        }
+    }
+
+At the end of a request the connection's transaction is rolled back and the
+connection kept for the next request of the same thread, until it is
+``CONN_MAX_AGE`` seconds old. Connections idle for more than
+``CONN_HEALTH_CHECK_INTERVAL`` seconds are pinged before being reused. With
+``POOL_SIZE`` set, released connections go to a pool shared by the threads of
+the process instead, since threaded servers start a new thread per request.
+
+Releasing a connection only rolls its transaction back. Session state that
+survives that, e.g. a committed ``SET`` or a temporary table on PostgreSQL,
+is seen by the next requests using the connection: set it with ``SET LOCAL``
+within the transaction that needs it, or drop it before the request ends.
+
+``close()`` only keeps the connection while a request is being served, which
+is when Django calls it to end the request; elsewhere, e.g. in management
+commands and the test runner, it still really closes it.
+"""
+import time
+import threading
+from Queue import Queue, Empty, Full
+
+from django.core import signals
+from django.utils.importlib import import_module
+
+_classes = {}
+_pools = {}
+_pools_lock = threading.Lock()
+_request = threading.local()
+
+
+def DatabaseWrapper(settings_dict, *args, **kwargs):
+    base = import_module('%s.base' % settings_dict['WRAPPED_ENGINE']).DatabaseWrapper
+    if base not in _classes:
+        _classes[base] = type('Persistent%s' % base.__name__, (PersistentConnectionMixin, base), {})
+    return _classes[base](settings_dict, *args, **kwargs)
+
+
+class PersistentConnectionMixin(object):
+    def __init__(self, *args, **kwargs):
+        super(PersistentConnectionMixin, self).__init__(*args, **kwargs)
+        self.max_age = self.settings_dict.get('CONN_MAX_AGE', 600)
+        self.health_check_interval = self.settings_dict.get('CONN_HEALTH_CHECK_INTERVAL', 30)
+        self.pool_size = self.settings_dict.get('POOL_SIZE', 0)
+        self.connected_at = None
+        self.released_at = None
+
+    def _cursor(self):
+        if self.connection is None and self.pool_size:
+            self._checkout()
+        if self.connection is not None and time.time() - self.released_at > self.health_check_interval:
+            if not self._is_usable():
+                self.force_close()
+
+        new = self.connection is None
+        cursor = super(PersistentConnectionMixin, self)._cursor()
+        if new:
+            self.connected_at = time.time()
+        self.released_at = time.time()
+        return cursor
+
+    def _is_usable(self):
+        try:
+            self.connection.cursor().execute('SELECT 1')
+        except Exception:
+            return False
+        return True
+
+    def _reset(self):
+        try:
+            self.connection.rollback()
+        except Exception:
+            return False
+        return True
+
+    def close(self):
+        if getattr(_request, 'active', False):
+            self.release()
+        else:
+            self.force_close()
+
+    def force_close(self):
+        super(PersistentConnectionMixin, self).close()
+
+    def release(self):
+        """
+        Keep the connection for later if it is young and sane, close it otherwise.
+        """
+        if self.connection is None:
+            return
+        if time.time() - self.connected_at >= self.max_age or not self._reset():
+            self.force_close()
+            return
+        self.released_at = time.time()
+        if self.pool_size:
+            self._checkin()
+
+    def _pool(self):
+        with _pools_lock:
+            if self.alias not in _pools:
+                _pools[self.alias] = Queue(self.pool_size)
+            return _pools[self.alias]
+
+    def _checkin(self):
+        try:
+            self._pool().put_nowait((self.connection, self.connected_at, self.released_at))
+        except Full:
+            self.connection.close()
+        self.connection = None
+
+    def _checkout(self):
+        pool = self._pool()
+        while True:
+            try:
+                self.connection, self.connected_at, self.released_at = pool.get_nowait()
+            except Empty:
+                return
+            if time.time() - self.connected_at < self.max_age:
+                return
+            self.force_close()
+
+
+def request_started(**kwargs):
+    _request.active = True
+    # Django closes the connections from a request_finished receiver, which
+    # must see the flag still set. That receiver is connected at the end of
+    # the import of django.db, which is still running when this module is
+    # loaded, so connecting this one now is the way to run after it.
+    signals.request_finished.connect(request_finished, dispatch_uid='core.db.backends.persistent')
+
+
+def request_finished(**kwargs):
+    _request.active = False
+
+signals.request_started.connect(request_started)
@@ -0,0 +1,30 @@
+"""
+SQLite backend tuned for serving: WAL journal and pragmas set on connect.
+
+In WAL mode readers never wait for the writer; writers still go one at a
+time, waiting up to the busy timeout for their turn. The pragmas can be
+overridden with a ``PRAGMAS`` dict in the database settings.
+"""
+from django.db.backends.sqlite3.base import DatabaseWrapper as SQLiteDatabaseWrapper
+
+PRAGMAS = (
+    ('journal_mode', 'WAL'),
+    # Durable across application crashes; a power loss may lose the last commits.
+    ('synchronous', 'NORMAL'),
+    ('busy_timeout', 5000),
+    ('mmap_size', 256 * 1024 * 1024),
+    # Negative sizes are in KiB.
+    ('cache_size', -16 * 1024),
+    ('temp_store', 'MEMORY'),
+)
+
+
+class DatabaseWrapper(SQLiteDatabaseWrapper):
+    def _sqlite_create_connection(self):
+        super(DatabaseWrapper, self)._sqlite_create_connection()
+        pragmas = dict(PRAGMAS)
+        pragmas.update(self.settings_dict.get('PRAGMAS', {}))
+        cursor = self.connection.cursor()
+        for name, value in sorted(pragmas.items()):
+            cursor.execute('PRAGMA %s = %s' % (name, value))
+        cursor.close()
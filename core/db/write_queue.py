@@ -0,0 +1,69 @@
+"""
+Funnel the database writes of a process through a single writer thread.
+
+SQLite lets one writer in at a time; threads of the same process racing for
+the write lock mostly spin in the busy handler. With ``SERIALIZE_DB_WRITES``
+the writes passed to ``serialized`` queue up for one thread per process that
+runs them one after the other, each in its own transaction, and hands the
+result or the exception back to the caller.
+
+In-memory SQLite databases are private to their connection, so writes to
+them always run in the calling thread.
+"""
+import sys
+import threading
+
+from django.conf import settings
+from django.db import connections, transaction
+from django.utils import six
+
+from core.workers import QueueWorker
+
+
+class WriteQueue(QueueWorker):
+    name = 'db-writer'
+
+    def in_writer(self):
+        return threading.current_thread() is self.thread
+
+    def run(self):
+        while True:
+            alias, func, args, kwargs, done, outcome = self.queue.get()
+            try:
+                with transaction.commit_on_success(using=alias):
+                    outcome.append((True, func(*args, **kwargs)))
+            except Exception:
+                outcome.append((False, sys.exc_info()))
+            done.set()
+
+    def submit(self, alias, func, *args, **kwargs):
+        """
+        Run ``func(*args, **kwargs)`` in the writer thread and return its result.
+        """
+        self.ensure_started()
+        done = threading.Event()
+        outcome = []
+        self.queue.put((alias, func, args, kwargs, done, outcome))
+        done.wait()
+        ok, value = outcome[0]
+        if not ok:
+            six.reraise(*value)
+        return value
+
+
+WRITE_QUEUE = WriteQueue()
+
+
+def is_in_memory(alias):
+    settings_dict = connections[alias].settings_dict
+    return connections[alias].vendor == 'sqlite' and settings_dict['NAME'] in ('', ':memory:')
+
+
+def serialized(alias, func, *args, **kwargs):
+    """
+    Run ``func(*args, **kwargs)``, a write to the ``alias`` database, through the writer thread.
+    """
+    if (not getattr(settings, 'SERIALIZE_DB_WRITES', False) or WRITE_QUEUE.in_writer()
+            or is_in_memory(alias)):
+        return func(*args, **kwargs)
+    return WRITE_QUEUE.submit(alias, func, *args, **kwargs)
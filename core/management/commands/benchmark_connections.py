@@ -0,0 +1,46 @@
+import time
+from optparse import make_option
+
+from django.core.management.base import NoArgsCommand
+from django.db import connections
+from django.db.utils import load_backend
+
+from core.benchmark import summarize
+
+PERSISTENT_ENGINE = 'core.db.backends.persistent'
+
+
+class Command(NoArgsCommand):
+    help = ("Compares the per-request cost of connecting to a database against reusing persistent "
+            "and pooled connections.")
+
+    option_list = NoArgsCommand.option_list + (
+        make_option('--database', dest='database', default='default',
+                    help='Database to connect to. Defaults to "default".'),
+        make_option('--requests', dest='requests', type='int', default=1000,
+                    help='Number of simulated requests per mode.'),
+    )
+
+    def handle_noargs(self, **options):
+        settings_dict = connections[options['database']].settings_dict
+        engine = settings_dict.get('WRAPPED_ENGINE', settings_dict['ENGINE'])
+        modes = (
+            ('per request', dict(settings_dict, ENGINE=engine)),
+            ('persistent', dict(settings_dict, ENGINE=PERSISTENT_ENGINE, WRAPPED_ENGINE=engine, POOL_SIZE=0)),
+            ('pooled', dict(settings_dict, ENGINE=PERSISTENT_ENGINE, WRAPPED_ENGINE=engine, POOL_SIZE=1)),
+        )
+
+        for name, mode_settings in modes:
+            connection = load_backend(mode_settings['ENGINE']).DatabaseWrapper(mode_settings, 'benchmark-%s' % name)
+            end_request = getattr(connection, 'release', connection.close)
+            latencies = []
+            for i in range(options['requests']):
+                start = time.time()
+                connection.cursor().execute('SELECT 1')
+                end_request()
+                latencies.append(time.time() - start)
+            getattr(connection, 'force_close', connection.close)()
+
+            summary = summarize(latencies)
+            self.stdout.write('%-12s %9.1f req/s  p50 %8.1fus  p99 %8.1fus' % (
+                name, summary['throughput'], summary['p50'] * 1000000, summary['p99'] * 1000000))
@@ -0,0 +1,26 @@
+import time
+from optparse import make_option
+
+from django.core.management.base import NoArgsCommand
+
+from core.sessions import clear_expired
+
+
+class Command(NoArgsCommand):
+    help = "Deletes the expired sessions from the database in batches, each in its own transaction."
+
+    option_list = NoArgsCommand.option_list + (
+        make_option('--batch-size', dest='batch_size', type='int', default=1000,
+                    help='Sessions deleted per transaction.'),
+        make_option('--pause', dest='pause', type='float', default=0.0,
+                    help='Seconds to sleep between two batches, to leave room to the other writers.'),
+    )
+
+    def handle_noargs(self, **options):
+        deleted = 0
+        for count in clear_expired(options['batch_size']):
+            deleted += count
+            if int(options['verbosity']) > 1:
+                self.stdout.write('%d expired sessions deleted' % deleted)
+            time.sleep(options['pause'])
+        self.stdout.write('%d expired sessions deleted' % deleted)
@@ -0,0 +1,41 @@
+from optparse import make_option
+
+from django.conf import settings
+from django.core.management.base import NoArgsCommand, CommandError
+
+from core.profiling import read_profiles
+
+
+class Command(NoArgsCommand):
+    help = "Merges the request profiles into a collapsed-stack report for flamegraph.pl or speedscope."
+
+    option_list = NoArgsCommand.option_list + (
+        make_option('--dir', dest='directory', default=None,
+                    help='Directory holding the profiles. Defaults to PROFILER_DIR.'),
+        make_option('--url-name', dest='url_name', default=None,
+                    help='Only report the requests to this URL name.'),
+        make_option('--output', dest='output', default=None,
+                    help='Write the report to this file instead of stdout.'),
+    )
+
+    def handle_noargs(self, **options):
+        directory = options['directory'] or getattr(settings, 'PROFILER_DIR', None)
+        if not directory:
+            raise CommandError("Set PROFILER_DIR or pass --dir.")
+
+        try:
+            stacks = read_profiles(directory)
+        except OSError as e:
+            raise CommandError("Can't read the profiles in %s: %s" % (directory, e))
+
+        if options['url_name']:
+            prefix = '%s;' % options['url_name']
+            stacks = dict((stack, count) for stack, count in stacks.items() if stack.startswith(prefix))
+
+        lines = ['%s %d\n' % (stack, count) for stack, count in sorted(stacks.items())]
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                f.writelines(line.encode('utf-8') for line in lines)
+        else:
+            for line in lines:
+                self.stdout.write(line, ending='')
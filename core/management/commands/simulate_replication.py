@@ -0,0 +1,72 @@
+import os
+import shutil
+import sqlite3
+import time
+from optparse import make_option
+
+from django.conf import settings
+from django.core.management.base import NoArgsCommand, CommandError
+from django.db import connections
+
+
+def copy_database(source, destination):
+    """
+    Copy the SQLite file ``source`` over ``destination`` as it is between two transactions.
+
+    In WAL mode the latest commits may only be in the ``-wal`` file: it is
+    copied too and folded into the copy, which is left in rollback journal
+    mode so it is a single file.
+    """
+    connection = sqlite3.connect(source, isolation_level=None)
+    try:
+        # A read transaction keeps writers from committing, and the WAL from
+        # being reset, while we copy.
+        connection.execute('BEGIN')
+        connection.execute('SELECT count(*) FROM sqlite_master').fetchall()
+        tmp_path = '%s.replicating' % destination
+        shutil.copyfile(source, tmp_path)
+        if os.path.exists('%s-wal' % source):
+            shutil.copyfile('%s-wal' % source, '%s-wal' % tmp_path)
+        connection.execute('COMMIT')
+    finally:
+        connection.close()
+
+    copy = sqlite3.connect(tmp_path, isolation_level=None)
+    try:
+        copy.execute('PRAGMA journal_mode = DELETE').fetchall()
+    finally:
+        copy.close()
+    os.rename(tmp_path, destination)
+
+
+class Command(NoArgsCommand):
+    help = ("Keeps the SQLite DATABASE_REPLICAS copies of the SQLite primary database, refreshed every --lag "
+            "seconds, to try the replica router locally.")
+
+    option_list = NoArgsCommand.option_list + (
+        make_option('--lag', dest='lag', type='float', default=2.0,
+                    help='Seconds between two refreshes of the replicas.'),
+        make_option('--once', dest='once', action='store_true', default=False,
+                    help='Refresh the replicas once and exit.'),
+    )
+
+    def handle_noargs(self, **options):
+        aliases = getattr(settings, 'DATABASE_REPLICAS', ())
+        if not aliases:
+            raise CommandError("DATABASE_REPLICAS is empty.")
+        for alias in ('default',) + tuple(aliases):
+            if connections[alias].vendor != 'sqlite':
+                raise CommandError("Replication can only be simulated between SQLite databases.")
+        for alias in aliases:
+            # The copy replaces the replica's file: a connection kept open across requests would keep
+            # reading the old one until it is recycled.
+            if connections[alias].settings_dict['ENGINE'] == 'core.db.backends.persistent':
+                raise CommandError("The replica '%s' must use a plain SQLite ENGINE, not "
+                                   "core.db.backends.persistent." % alias)
+
+        while True:
+            for alias in aliases:
+                copy_database(connections['default'].settings_dict['NAME'], connections[alias].settings_dict['NAME'])
+            if options['once']:
+                break
+            time.sleep(options['lag'])
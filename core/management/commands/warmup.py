@@ -0,0 +1,13 @@
+from django.core.management.base import NoArgsCommand
+
+from core.warmup import warm_up
+
+
+class Command(NoArgsCommand):
+    help = "Loads the URLconfs, templates, translations and database connections and reports the time each took."
+
+    def handle_noargs(self, **options):
+        timings = warm_up()
+        for name, seconds in timings:
+            self.stdout.write('%-20s %8.1fms' % (name, seconds * 1000))
+        self.stdout.write('%-20s %8.1fms' % ('total', sum(seconds for name, seconds in timings) * 1000))
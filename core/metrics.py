@@ -0,0 +1,421 @@
+"""
+In-process metrics exposed in the Prometheus text format.
+
+Every process accumulates its counters and histograms in memory and, at most
+every ``METRICS_FLUSH_INTERVAL`` seconds, dumps them to a file of its own under
+``METRICS_DIR``. The ``metrics`` view merges all the dumps found there, so a
+scrape covers every WSGI worker no matter which one answers it. The dumps of
+processes that are gone are folded into an archive, so the counters never go
+down; the directory must only be shared by the processes of one host.
+
+Recording a metric never fails: dumps that can't be written are logged.
+"""
+import errno
+import fcntl
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BUCKETS = (.001, .0025, .005, .01, .025, .05, .1, .25, .5, 1.0, 2.5, 5.0, 10.0)
+
+
+ARCHIVE_NAME = 'archive'
+
+
+def _exited(filename):
+    """
+    Whether ``filename`` is the dump, or a temporary dump, of a process that exited.
+    """
+    try:
+        pid = int(filename.split('-', 1)[0])
+    except ValueError:
+        return False
+    if pid == os.getpid():
+        return False
+    try:
+        os.kill(pid, 0)
+    except OSError as e:
+        return e.errno == errno.ESRCH
+    return False
+
+
+def _read_json(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (IOError, ValueError):
+        # Missing, or being replaced by its owner right now.
+        return None
+
+
+@contextmanager
+def _locked(directory, exclusive=False):
+    with open(os.path.join(directory, 'lock'), 'a') as f:
+        fcntl.flock(f, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+        yield
+
+
+class Registry(object):
+    def __init__(self):
+        self.metrics = {}
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self._pid = os.getpid()
+        self._started = int(time.time() * 1000)
+        self._values = {}
+        self._last_flush = time.time()
+
+    def register(self, metric):
+        if metric.name in self.metrics:
+            raise ValueError('Metric %s is already registered' % metric.name)
+        self.metrics[metric.name] = metric
+
+    def _check_pid(self):
+        if self._pid != os.getpid():
+            # Forked after recording something: the parent keeps those.
+            self._reset()
+
+    def update(self, key, func):
+        with self._lock:
+            self._check_pid()
+            self._values[key] = func(self._values.get(key))
+        if time.time() - self._last_flush >= getattr(settings, 'METRICS_FLUSH_INTERVAL', 5):
+            self.flush()
+
+    def snapshot(self):
+        with self._lock:
+            self._check_pid()
+            return [[name, list(labels), value] for (name, labels), value in self._values.items()]
+
+    def dump_path(self):
+        directory = getattr(settings, 'METRICS_DIR', None)
+        if not directory:
+            return None
+        return os.path.join(directory, '%d-%d.json' % (self._pid, self._started))
+
+    def flush(self):
+        # One thread at a time; the others go on, their values make the next dump.
+        if not self._flush_lock.acquire(False):
+            return
+        try:
+            self._last_flush = time.time()
+            path = self.dump_path()
+            if path is None:
+                return
+            try:
+                try:
+                    os.makedirs(os.path.dirname(path))
+                except OSError as e:
+                    if e.errno != errno.EEXIST:
+                        raise
+                tmp_path = '%s.%d.tmp' % (path, threading.current_thread().ident)
+                with open(tmp_path, 'w') as f:
+                    json.dump(self.snapshot(), f)
+                os.rename(tmp_path, path)
+            except (IOError, OSError):
+                logger.exception('Could not write the metrics to %s', path)
+        finally:
+            self._flush_lock.release()
+
+    def prune(self, directory):
+        """
+        Fold the dumps of the processes that exited into the archive, then remove them.
+
+        The merged counters and histograms would go down otherwise, which
+        Prometheus takes for a restart.
+        """
+        exited = [filename for filename in os.listdir(directory) if _exited(filename)]
+        if not exited:
+            return
+        archive_path = os.path.join(directory, ARCHIVE_NAME)
+        with _locked(directory, exclusive=True):
+            archive = _read_json(archive_path) or {'folded': [], 'values': []}
+            dumps = [archive['values']]
+            folded = []
+            for filename in exited:
+                if filename in archive['folded'] or not filename.endswith('.json'):
+                    # Folded before the previous prune got to remove it, or a temporary file.
+                    continue
+                try:
+                    with open(os.path.join(directory, filename)) as f:
+                        dumps.append(json.load(f))
+                except IOError:
+                    # Removed by another prune since we listed it.
+                    continue
+                except ValueError:
+                    pass
+                else:
+                    folded.append(filename)
+
+            merged = self.merge(dumps)
+            tmp_path = '%s.%d.tmp' % (archive_path, os.getpid())
+            with open(tmp_path, 'w') as f:
+                json.dump({'folded': folded,
+                           'values': [[name, labels, value] for (name, labels), value in merged.items()]}, f)
+            os.rename(tmp_path, archive_path)
+            for filename in exited:
+                try:
+                    os.remove(os.path.join(directory, filename))
+                except OSError:
+                    pass
+
+    def merge(self, dumps):
+        """
+        Merge dumps into ``{(name, labels): value}``.
+        """
+        merged = {}
+        for dump in dumps:
+            for name, labels, value in dump:
+                metric = self.metrics.get(name)
+                if metric is None:
+                    continue
+                key = (name, tuple(tuple(label) for label in labels))
+                merged[key] = metric.merge(merged.get(key), value)
+        return merged
+
+    def collect(self):
+        """
+        Merge the dumps of every process, and the archive of those that exited, into ``{(name, labels): value}``.
+        """
+        self.flush()
+        directory = getattr(settings, 'METRICS_DIR', None)
+        if not directory or not os.path.isdir(directory):
+            return self.merge([self.snapshot()])
+
+        try:
+            self.prune(directory)
+        except (IOError, OSError):
+            logger.exception('Could not archive the metrics of the exited processes in %s', directory)
+        dumps = []
+        # The archive and the dumps it folds are read together.
+        with _locked(directory):
+            archive = _read_json(os.path.join(directory, ARCHIVE_NAME))
+            if archive is not None:
+                dumps.append(archive['values'])
+            for filename in os.listdir(directory):
+                if not filename.endswith('.json') or (archive is not None and filename in archive['folded']):
+                    continue
+                dump = _read_json(os.path.join(directory, filename))
+                if dump is not None:
+                    dumps.append(dump)
+        return self.merge(dumps)
+
+    def render(self):
+        """
+        Return every registered metric in the Prometheus text exposition format.
+        """
+        merged = self.collect()
+        lines = []
+        for name in sorted(self.metrics):
+            metric = self.metrics[name]
+            lines.append('# HELP %s %s' % (name, metric.documentation))
+            lines.append('# TYPE %s %s' % (name, metric.type))
+            for (key_name, labels), value in sorted(merged.items()):
+                if key_name == name:
+                    lines.extend(metric.expose(labels, value))
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+
+def _format_labels(labels, extra=()):
+    labels = tuple(labels) + tuple(extra)
+    if not labels:
+        return ''
+    return '{%s}' % ','.join('%s="%s"' % (key, str(value).replace('\\', r'\\').replace('"', r'\"'))
+                             for key, value in labels)
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value))
+
+
+class Counter(object):
+    type = 'counter'
+
+    def __init__(self, name, documentation, registry=REGISTRY):
+        self.name = name
+        self.documentation = documentation
+        self.registry = registry
+        registry.register(self)
+
+    def inc(self, amount=1, **labels):
+        self.registry.update((self.name, tuple(sorted(labels.items()))),
+                             lambda value: (value or 0) + amount)
+
+    def merge(self, value, other):
+        return (value or 0) + other
+
+    def expose(self, labels, value):
+        return ['%s%s %s' % (self.name, _format_labels(labels), _format_value(value))]
+
+
+class Histogram(object):
+    type = 'histogram'
+
+    def __init__(self, name, documentation, buckets=DEFAULT_BUCKETS, registry=REGISTRY):
+        self.name = name
+        self.documentation = documentation
+        self.buckets = tuple(buckets)
+        self.registry = registry
+        registry.register(self)
+
+    def observe(self, amount, **labels):
+        def add(value):
+            if value is None:
+                value = [[0] * (len(self.buckets) + 1), 0.0]
+            for i, bound in enumerate(self.buckets):
+                if amount <= bound:
+                    break
+            else:
+                i = len(self.buckets)
+            value[0][i] += 1
+            value[1] += amount
+            return value
+
+        self.registry.update((self.name, tuple(sorted(labels.items()))), add)
+
+    def time(self, **labels):
+        return _Timer(self, labels)
+
+    def merge(self, value, other):
+        if value is None:
+            return [list(other[0]), other[1]]
+        return [[a + b for a, b in zip(value[0], other[0])], value[1] + other[1]]
+
+    def expose(self, labels, value):
+        counts, total = value
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float('inf'),), counts):
+            cumulative += count
+            lines.append('%s_bucket%s %d' % (self.name, _format_labels(labels, [('le', _format_value(bound))]),
+                                             cumulative))
+        lines.append('%s_sum%s %s' % (self.name, _format_labels(labels), _format_value(total)))
+        lines.append('%s_count%s %d' % (self.name, _format_labels(labels), cumulative))
+        return lines
+
+
+class _Timer(object):
+    """
+    Observe the wall time of a ``with`` block or of every call to a decorated function.
+    """
+
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.time()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.histogram.observe(time.time() - self.start, **self.labels)
+
+    def __call__(self, func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with _Timer(self.histogram, self.labels):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+
+VIEW_SECONDS = Histogram('http_view_seconds', 'Time spent in instrumented views.')
+VIEW_RESPONSES = Counter('http_view_responses_total', 'Responses returned by instrumented views.')
+DB_QUERY_SECONDS = Histogram('db_query_seconds', 'Time spent executing database queries.')
+
+
+def timed_view(view, name):
+    """
+    Wrap ``view`` so its latency and response codes are recorded under ``name``.
+    """
+
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        start = time.time()
+        response = view(request, *args, **kwargs)
+
+        def observe(response):
+            VIEW_SECONDS.observe(time.time() - start, view=name)
+            VIEW_RESPONSES.inc(view=name, status=response.status_code)
+
+        if getattr(response, 'is_rendered', True):
+            observe(response)
+        else:
+            # TemplateResponses are rendered by the handler, after we return.
+            response.add_post_render_callback(observe)
+        return response
+
+    return wrapper
+
+
+class TimedCursor(object):
+    def __init__(self, cursor, alias):
+        self.cursor = cursor
+        self.alias = alias
+
+    def execute(self, sql, params=()):
+        start = time.time()
+        try:
+            return self.cursor.execute(sql, params)
+        finally:
+            DB_QUERY_SECONDS.observe(time.time() - start, alias=self.alias)
+
+    def executemany(self, sql, param_list):
+        start = time.time()
+        try:
+            return self.cursor.executemany(sql, param_list)
+        finally:
+            DB_QUERY_SECONDS.observe(time.time() - start, alias=self.alias)
+
+    def __getattr__(self, attr):
+        return getattr(self.cursor, attr)
+
+    def __iter__(self):
+        return iter(self.cursor)
+
+
+def instrument_connection(connection):
+    """
+    Make every cursor of ``connection`` report its query time.
+
+    Connections live per thread across requests, so this only does work
+    the first time a thread sees a given alias.
+    """
+    if getattr(connection, '_metrics_instrumented', False):
+        return
+    cursor = connection.cursor
+    connection.cursor = lambda: TimedCursor(cursor(), connection.alias)
+    connection._metrics_instrumented = True
+
+
+def instrument_new_connection(sender, connection, **kwargs):
+    # Covers the threads that don't serve requests: the database writer and the background tasks.
+    # The cursor being opened when the connection is made isn't timed.
+    instrument_connection(connection)
+
+
+connection_created.connect(instrument_new_connection)
+
+
+class MetricsMiddleware(object):
+    def process_request(self, request):
+        for connection in connections.all():
+            instrument_connection(connection)
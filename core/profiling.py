@@ -0,0 +1,155 @@
+"""
+Opt-in sampling profiler for individual requests.
+
+A sampled request gets a companion thread that records the stack of the
+request thread every ``PROFILER_INTERVAL`` seconds. The samples are written,
+gzipped, to ``PROFILER_DIR`` in the collapsed-stack format understood by
+flamegraph.pl and speedscope, one ``frame;frame;frame count`` line per stack.
+"""
+import errno
+import gzip
+import logging
+import os
+import random
+import sys
+import threading
+import time
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+
+logger = logging.getLogger(__name__)
+
+
+class StackSampler(threading.Thread):
+    """
+    Count the distinct stacks seen on another thread until stopped.
+    """
+
+    def __init__(self, thread_id, interval):
+        super(StackSampler, self).__init__()
+        self.daemon = True
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = {}
+        self.finished = threading.Event()
+
+    def run(self):
+        while not self.finished.is_set():
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is not None:
+                stack = self.collapse(frame)
+                self.stacks[stack] = self.stacks.get(stack, 0) + 1
+            self.finished.wait(self.interval)
+
+    def stop(self):
+        self.finished.set()
+        self.join()
+        return self.stacks
+
+    @staticmethod
+    def collapse(frame):
+        frames = []
+        while frame is not None:
+            code = frame.f_code
+            frames.append('%s (%s:%d)' % (code.co_name, code.co_filename, code.co_firstlineno))
+            frame = frame.f_back
+        frames.reverse()
+        return ';'.join(frames)
+
+
+def write_profile(directory, root, stacks, keep):
+    """
+    Write ``stacks`` under a ``root`` frame and drop all but the newest ``keep`` profiles.
+
+    Never raises: a profile that can't be written is logged, not turned into an error response.
+    """
+    filename = 'profile-%d-%d-%d.txt.gz' % (time.time() * 1000000, os.getpid(), threading.current_thread().ident)
+    path = os.path.join(directory, filename)
+    try:
+        try:
+            os.makedirs(directory)
+        except OSError as e:
+            if e.errno != errno.EEXIST:
+                raise
+        # Readers only see complete profiles.
+        tmp_path = os.path.join(directory, 'tmp-%s' % filename)
+        with gzip.open(tmp_path, 'wb') as f:
+            for stack, count in stacks.items():
+                f.write(('%s;%s %d\n' % (root, stack, count)).encode('utf-8'))
+        os.rename(tmp_path, path)
+
+        profiles = sorted(name for name in os.listdir(directory) if name.startswith('profile-'))
+    except (IOError, OSError):
+        logger.exception('Could not write the profile %s', path)
+        return
+    for name in profiles[:-keep]:
+        try:
+            os.remove(os.path.join(directory, name))
+        except OSError:
+            # Another worker pruned it first.
+            pass
+
+
+def read_profiles(directory):
+    """
+    Merge every profile in ``directory`` into ``{stack: count}``.
+    """
+    stacks = {}
+    for name in sorted(os.listdir(directory)):
+        if not name.startswith('profile-'):
+            continue
+        try:
+            with gzip.open(os.path.join(directory, name), 'rb') as f:
+                lines = f.readlines()
+        except IOError:
+            # Pruned by a worker since listed.
+            continue
+        for line in lines:
+            stack, count = line.decode('utf-8').rstrip('\n').rsplit(' ', 1)
+            stacks[stack] = stacks.get(stack, 0) + int(count)
+    return stacks
+
+
+class SamplingProfilerMiddleware(object):
+    """
+    Profile a fraction of the requests, or the ones asking for it.
+
+    A request is sampled with probability ``PROFILER_SAMPLE_RATE``, or always
+    when it carries the ``PROFILER_HEADER`` header and comes from one of the
+    ``INTERNAL_IPS``. ``PROFILER_URL_NAMES``, when set, restricts sampling to
+    those URL names. Put it first in ``MIDDLEWARE_CLASSES`` to cover the
+    other middleware too.
+    """
+
+    def __init__(self):
+        self.directory = getattr(settings, 'PROFILER_DIR', None)
+        self.rate = getattr(settings, 'PROFILER_SAMPLE_RATE', 0)
+        self.header = getattr(settings, 'PROFILER_HEADER', None)
+        self.url_names = frozenset(getattr(settings, 'PROFILER_URL_NAMES', ()))
+        self.interval = getattr(settings, 'PROFILER_INTERVAL', 0.005)
+        self.keep = getattr(settings, 'PROFILER_MAX_FILES', 500)
+        if not self.directory or not (self.rate or self.header):
+            raise MiddlewareNotUsed
+
+    def process_request(self, request):
+        if random.random() < self.rate or (self.header and self.header in request.META and
+                                           request.META.get('REMOTE_ADDR') in settings.INTERNAL_IPS):
+            request._profiler = StackSampler(threading.current_thread().ident, self.interval)
+            request._profiler.start()
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        sampler = getattr(request, '_profiler', None)
+        if sampler is not None and self.url_names and request.resolver_match.url_name not in self.url_names:
+            sampler.stop()
+            del request._profiler
+
+    def process_response(self, request, response):
+        sampler = getattr(request, '_profiler', None)
+        if sampler is not None:
+            del request._profiler
+            stacks = sampler.stop()
+            match = getattr(request, 'resolver_match', None)
+            root = match and match.url_name or request.path
+            write_profile(self.directory, root.replace(';', ':').replace(' ', '_'), stacks, self.keep)
+        return response
@@ -0,0 +1,134 @@
+"""
+Session engine keeping sessions in the cache, written through to the database in the background.
+
+Reads come from the cache and only fall back to the database when the
+session isn't cached, e.g. after an eviction or a restart. Writes and
+deletes go to the cache right away and to the database through
+``core.tasks.defer``, so requests don't wait for the sessions table. A
+deleted session leaves a marker in the cache, so it isn't loaded back from
+the database before the deferred delete has run. The
+cache must be shared by every process (memcached, not locmem): a session
+written elsewhere may not have reached the database yet, and one deleted
+elsewhere would live on in a local cache. A warning is issued when this
+engine is used with a default cache local to the process.
+
+As with any session engine, nothing is read until the session is used.
+New sessions aren't written until the response saves them, so rotating
+the key on login costs two cache writes and a deferred delete.
+"""
+import warnings
+
+from django.conf import settings
+from django.contrib.sessions.backends.base import CreateError, VALID_KEY_CHARS
+from django.contrib.sessions.backends.cached_db import KEY_PREFIX, SessionStore as CachedDBStore
+from django.contrib.sessions.models import Session
+from django.core.cache import cache
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.exceptions import SuspiciousOperation
+from django.db import router, transaction
+from django.utils import timezone
+from django.utils.crypto import get_random_string
+
+from core.db.write_queue import serialized
+from core.tasks import defer
+
+if settings.SESSION_ENGINE == __name__ and isinstance(cache, (LocMemCache, DummyCache)):
+    warnings.warn("core.sessions needs a cache shared by all the processes, the default cache is %s: "
+                  "sessions logged out in one process stay alive in the others." % type(cache).__name__,
+                  RuntimeWarning)
+
+DELETED = '__deleted__'
+
+
+def _write(alias, session):
+    serialized(alias, session.save, using=alias)
+
+
+def _delete(alias, session_key):
+    serialized(alias, Session.objects.using(alias).filter(session_key=session_key).delete)
+
+
+class SessionStore(CachedDBStore):
+    def _get_new_session_key(self):
+        # 32 random characters don't collide: skip the lookups in the cache and the database.
+        return get_random_string(32, VALID_KEY_CHARS)
+
+    def create(self):
+        """
+        Start a new, empty session, only written when it is saved.
+        """
+        self._session_key = self._get_new_session_key()
+        self._session_cache = {}
+        self.modified = True
+
+    def load(self):
+        try:
+            data = cache.get(self.cache_key)
+        except Exception:
+            # Invalid keys raise on some backends, see Django's cached_db.
+            data = None
+        if data == DELETED:
+            self.create()
+            return {}
+        if data is None:
+            try:
+                session = Session.objects.get(session_key=self.session_key, expire_date__gt=timezone.now())
+                data = self.decode(session.session_data)
+                cache.set(self.cache_key, data, self.get_expiry_age(expiry=session.expire_date))
+            except (Session.DoesNotExist, SuspiciousOperation):
+                self.create()
+                data = {}
+        return data
+
+    def exists(self, session_key):
+        data = cache.get(KEY_PREFIX + session_key)
+        if data is not None:
+            return data != DELETED
+        return Session.objects.filter(session_key=session_key).exists()
+
+    def save(self, must_create=False):
+        data = self._get_session(no_load=must_create)
+        if must_create:
+            if not cache.add(self.cache_key, data, self.get_expiry_age()):
+                raise CreateError
+        else:
+            cache.set(self.cache_key, data, self.get_expiry_age())
+
+        session = Session(session_key=self.session_key, session_data=self.encode(data),
+                          expire_date=self.get_expiry_date())
+        alias = router.db_for_write(Session, instance=session)
+        defer(alias, _write, alias, session)
+
+    def delete(self, session_key=None):
+        if session_key is None:
+            if self.session_key is None:
+                return
+            session_key = self.session_key
+        # Until the database row is gone, a cache miss would load the session back from it.
+        cache.set(KEY_PREFIX + session_key, DELETED, settings.SESSION_COOKIE_AGE)
+        alias = router.db_for_write(Session)
+        defer(alias, _delete, alias, session_key)
+
+    @classmethod
+    def clear_expired(cls, batch_size=1000):
+        return sum(clear_expired(batch_size))
+
+
+def clear_expired(batch_size=1000):
+    """
+    Delete the expired sessions ``batch_size`` at a time, yielding the number deleted per batch.
+
+    Short transactions don't hold the sessions table for long, which on
+    SQLite means every other writer.
+    """
+    now = timezone.now()
+    alias = router.db_for_write(Session)
+    while True:
+        keys = list(Session.objects.using(alias).filter(expire_date__lt=now)
+                    .values_list('session_key', flat=True)[:batch_size])
+        if not keys:
+            break
+        with transaction.commit_on_success(using=alias):
+            Session.objects.using(alias).filter(session_key__in=keys).delete()
+        yield len(keys)
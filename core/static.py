@@ -0,0 +1,113 @@
+"""
+WSGI middleware serving the collected static files ahead of Django.
+
+Files whose names carry a content hash, as written by
+``core.storage.CompressedCachedStaticFilesStorage``, never change and are
+cached for a year; the others have to be revalidated. The ``.br`` and
+``.gz`` variants are served to the clients that accept them, and files go
+out through the server's ``wsgi.file_wrapper`` (sendfile) when it has one.
+"""
+import mimetypes
+import os
+import re
+from email.utils import formatdate
+
+from django.conf import settings
+
+HASHED_NAME_RE = re.compile(r'\.[0-9a-f]{12}\.[^/.]+$')
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+BLOCK_SIZE = 64 * 1024
+
+
+def accepted_encodings(header):
+    """
+    The content codings an Accept-Encoding header allows.
+    """
+    accepted = set()
+    refused = set()
+    for part in header.split(','):
+        coding, _, params = part.partition(';')
+        coding = coding.strip().lower()
+        q = 1.0
+        for param in params.split(';'):
+            name, _, value = param.partition('=')
+            if name.strip() == 'q':
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        (accepted if q > 0 else refused).add(coding)
+    if '*' in accepted:
+        accepted.update(coding for coding, extension in ENCODINGS if coding not in refused)
+    return accepted
+
+
+class StaticFilesMiddleware(object):
+    def __init__(self, application, root=None, prefix=None):
+        self.application = application
+        root = root or settings.STATIC_ROOT
+        self.root = root and os.path.abspath(root)
+        self.prefix = prefix or settings.STATIC_URL
+        self.max_age = getattr(settings, 'STATIC_HASHED_MAX_AGE', 365 * 24 * 3600)
+
+    def __call__(self, environ, start_response):
+        path = environ.get('PATH_INFO', '')
+        if (not self.root or environ.get('REQUEST_METHOD') not in ('GET', 'HEAD') or
+                not path.startswith(self.prefix)):
+            return self.application(environ, start_response)
+
+        name = path[len(self.prefix):]
+        filename = os.path.normpath(os.path.join(self.root, name))
+        if not filename.startswith(self.root + os.sep) or not os.path.isfile(filename):
+            return self.application(environ, start_response)
+
+        encoding = None
+        accepted = accepted_encodings(environ.get('HTTP_ACCEPT_ENCODING', ''))
+        for coding, extension in ENCODINGS:
+            if coding in accepted and os.path.isfile(filename + extension):
+                encoding = coding
+                break
+        served = encoding and filename + dict(ENCODINGS)[encoding] or filename
+
+        stat = os.stat(served)
+        etag = '"%x-%x%s"' % (int(stat.st_mtime), stat.st_size, encoding and '-' + encoding or '')
+        if HASHED_NAME_RE.search(name):
+            cache_control = 'public, max-age=%d' % self.max_age
+        else:
+            cache_control = 'public, no-cache'
+        headers = [
+            ('Cache-Control', cache_control),
+            ('ETag', etag),
+            ('Last-Modified', formatdate(stat.st_mtime, usegmt=True)),
+            ('Vary', 'Accept-Encoding'),
+        ]
+
+        if etag in environ.get('HTTP_IF_NONE_MATCH', ''):
+            start_response('304 Not Modified', headers)
+            return []
+
+        content_type, _ = mimetypes.guess_type(filename)
+        headers.append(('Content-Type', content_type or 'application/octet-stream'))
+        headers.append(('Content-Length', str(stat.st_size)))
+        if encoding:
+            headers.append(('Content-Encoding', encoding))
+        start_response('200 OK', headers)
+        if environ['REQUEST_METHOD'] == 'HEAD':
+            return []
+
+        f = open(served, 'rb')
+        file_wrapper = environ.get('wsgi.file_wrapper')
+        if file_wrapper is not None:
+            return file_wrapper(f, BLOCK_SIZE)
+        return FileIterator(f)
+
+
+class FileIterator(object):
+    def __init__(self, f):
+        self.f = f
+
+    def __iter__(self):
+        return iter(lambda: self.f.read(BLOCK_SIZE), b'')
+
+    def close(self):
+        self.f.close()
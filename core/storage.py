@@ -0,0 +1,60 @@
+"""
+Static files storage writing precompressed variants of the collected files.
+"""
+import gzip
+import os
+
+from django.contrib.staticfiles.storage import CachedStaticFilesStorage
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESSIBLE_EXTENSIONS = ('.css', '.js', '.map', '.svg', '.html', '.txt', '.json', '.xml', '.ico', '.eot',
+                           '.ttf', '.otf')
+
+# Variants saving less than this fraction of the original aren't worth a negotiation.
+MIN_SAVING = 0.05
+
+
+def _write_gzip(path, content):
+    with open(path, 'wb') as f:
+        # No file name or mtime in the header: the same file always compresses the same.
+        with gzip.GzipFile('', 'wb', 9, f, mtime=0) as compressed:
+            compressed.write(content)
+
+
+def _write_brotli(path, content):
+    with open(path, 'wb') as f:
+        f.write(brotli.compress(content))
+
+
+class CompressedCachedStaticFilesStorage(CachedStaticFilesStorage):
+    """
+    ``CachedStaticFilesStorage`` that also writes a ``.gz`` variant of the
+    text files it collects, and a ``.br`` one if the ``brotli`` module is
+    installed, for ``core.static.StaticFilesMiddleware`` to serve.
+    """
+
+    def post_process(self, paths, dry_run=False, **options):
+        for name, hashed_name, processed in super(CompressedCachedStaticFilesStorage, self).post_process(
+                paths, dry_run, **options):
+            if not isinstance(processed, Exception):
+                for compressed_name in set((name, hashed_name)):
+                    self.compress(compressed_name)
+            yield name, hashed_name, processed
+
+    def compress(self, name):
+        if not name.lower().endswith(COMPRESSIBLE_EXTENSIONS) or not self.exists(name):
+            return
+        path = self.path(name)
+        with open(path, 'rb') as f:
+            content = f.read()
+        writers = [('.gz', _write_gzip)]
+        if brotli is not None:
+            writers.append(('.br', _write_brotli))
+        for extension, write in writers:
+            write(path + extension, content)
+            if os.path.getsize(path + extension) > len(content) * (1 - MIN_SAVING):
+                os.remove(path + extension)
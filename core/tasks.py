@@ -0,0 +1,68 @@
+"""
+Work deferred to a background thread, so the request doesn't wait for it.
+
+``defer`` queues a call for the single background thread of the process.
+Deferred calls may be lost if the process dies; only defer what can be
+redone. When ``TASK_QUEUE_SIZE`` calls are already waiting, or when the
+call touches an in-memory SQLite database, which other threads can't see,
+it runs inline instead.
+"""
+import logging
+from Queue import Queue, Full
+
+from django.conf import settings
+from django.db import connections
+
+from core.db.write_queue import is_in_memory
+from core.workers import QueueWorker
+
+logger = logging.getLogger(__name__)
+
+
+class TaskQueue(QueueWorker):
+    name = 'background-tasks'
+
+    def make_queue(self):
+        return Queue(getattr(settings, 'TASK_QUEUE_SIZE', 1000))
+
+    def run(self):
+        while True:
+            func, args, kwargs = self.queue.get()
+            try:
+                func(*args, **kwargs)
+            except Exception:
+                logger.exception('Deferred %r failed', func)
+                # Don't leave a failed transaction open for the next call.
+                for connection in connections.all():
+                    connection.close()
+            finally:
+                self.queue.task_done()
+
+    def put(self, func, *args, **kwargs):
+        """
+        Queue ``func(*args, **kwargs)``; False if the queue is full.
+        """
+        self.ensure_started()
+        try:
+            self.queue.put_nowait((func, args, kwargs))
+        except Full:
+            return False
+        return True
+
+    def join(self):
+        """
+        Wait until every call queued so far has run.
+        """
+        if self.is_started():
+            self.queue.join()
+
+
+TASKS = TaskQueue()
+
+
+def defer(alias, func, *args, **kwargs):
+    """
+    Run ``func(*args, **kwargs)`` in the background; ``alias`` is the database it uses, if any.
+    """
+    if (alias is not None and is_in_memory(alias)) or not TASKS.put(func, *args, **kwargs):
+        func(*args, **kwargs)
@@ -5,7 +5,28 @@ when you run "manage.py test".
 Replace this with more appropriate tests for your application.
 """
 
+import datetime
+import os
+import shutil
+import tempfile
+import threading
+
+from django.contrib.sessions.models import Session
+from django.core.cache import cache
+from django.core.urlresolvers import reverse
 from django.test import TestCase
+from django.utils import timezone
+
+from accounts.models import User
+from core.benchmark import compare, summarize
+from core.db.backends.persistent.base import (DatabaseWrapper as PersistentDatabaseWrapper, _pools,
+                                               request_finished, request_started)
+from core.db.write_queue import WriteQueue
+from core.metrics import Counter, Histogram, Registry
+from core.profiling import read_profiles
+from core import sessions
+from core.sessions import SessionStore, clear_expired
+from core.static import StaticFilesMiddleware
 
 
 class SimpleTest(TestCase):
@@ -14,3 +35,322 @@ class SimpleTest(TestCase):
         Tests that 1 + 1 always equals 2.
         """
         self.assertEqual(1 + 1, 2)
+
+
+class AnonymousCacheTest(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_conditional_get(self):
+        """
+        The home page is cached with a strong ETag and revalidated with a 304.
+        """
+        response = self.client.get(reverse('core:home'))
+        self.assertEqual(response.status_code, 200)
+        etag = response['ETag']
+
+        response = self.client.get(reverse('core:home'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['ETag'], etag)
+
+        response = self.client.get(reverse('core:home'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+    def test_authenticated_not_cached(self):
+        User.objects.create_user('foo@bar.com', 'secret')
+        self.client.login(username='foo@bar.com', password='secret')
+
+        response = self.client.get(reverse('core:home'))
+        self.assertFalse(response.has_header('ETag'))
+        self.assertContains(response, 'foo@bar.com')
+
+
+class MetricsTest(TestCase):
+    def test_histogram_exposition(self):
+        """
+        Histograms are exposed with cumulative buckets, sum and count.
+        """
+        registry = Registry()
+        histogram = Histogram('test_seconds', 'Test histogram.', buckets=(.1, 1), registry=registry)
+        histogram.observe(.05, view='home')
+        histogram.observe(.5, view='home')
+        histogram.observe(5, view='home')
+
+        with self.settings(METRICS_DIR=None):
+            output = registry.render()
+
+        self.assertIn('# TYPE test_seconds histogram', output)
+        self.assertIn('test_seconds_bucket{view="home",le="0.1"} 1', output)
+        self.assertIn('test_seconds_bucket{view="home",le="1.0"} 2', output)
+        self.assertIn('test_seconds_bucket{view="home",le="+Inf"} 3', output)
+        self.assertIn('test_seconds_count{view="home"} 3', output)
+
+    def test_metrics_view(self):
+        with self.settings(METRICS_DIR=None):
+            response = self.client.get(reverse('metrics'))
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('# TYPE accounts_registration_seconds histogram', response.content)
+
+    def test_dumps_of_exited_processes_archived(self):
+        """
+        The dumps of the processes that exited are folded into the archive: counters don't go down.
+        """
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        registry = Registry()
+        counter = Counter('test_total', 'Test counter.', registry=registry)
+        with self.settings(METRICS_DIR=directory):
+            for i in range(2):
+                pid = os.fork()
+                if not pid:
+                    counter.inc(2)
+                    registry.flush()
+                    os._exit(0)
+                os.waitpid(pid, 0)
+                counter.inc()
+
+                for j in range(2):
+                    self.assertIn('test_total %d' % (3 * (i + 1)), registry.render())
+            self.assertEqual(sorted(os.listdir(directory)),
+                             sorted([os.path.basename(registry.dump_path()), 'archive', 'lock']))
+
+    def test_flush_errors_logged(self):
+        """
+        Recording a metric doesn't fail when its dump can't be written.
+        """
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        path = os.path.join(directory, 'file')
+        open(path, 'w').close()
+
+        registry = Registry()
+        histogram = Histogram('test_seconds', 'Test histogram.', registry=registry)
+        with self.settings(METRICS_DIR=os.path.join(path, 'metrics'), METRICS_FLUSH_INTERVAL=0):
+            histogram.observe(.5)
+
+
+class BenchmarkCompareTest(TestCase):
+    def test_scenarios_without_requests(self):
+        empty = summarize([])
+        full = summarize([.1, .2])
+        baseline = {'scenarios': {'empty': empty, 'full': full}}
+        self.assertEqual(compare({'scenarios': {'empty': full, 'full': full}}, baseline, .2), [])
+        self.assertEqual(compare({'scenarios': {'empty': empty, 'full': empty}}, baseline, .2),
+                         ['full: no successful requests'])
+
+
+class SamplingProfilerTest(TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_profile_requested_by_header(self):
+        """
+        Requests from INTERNAL_IPS carrying the profiling header are sampled.
+        """
+        with self.settings(PROFILER_DIR=self.directory, PROFILER_SAMPLE_RATE=0, PROFILER_INTERVAL=0.0001):
+            self.client.get(reverse('auth_login'))
+            self.assertEqual(read_profiles(self.directory), {})
+
+            self.client.get(reverse('auth_login'), HTTP_X_PROFILE='1')
+
+        stacks = read_profiles(self.directory)
+        self.assertTrue(stacks)
+        self.assertTrue(all(stack.startswith('auth_login;') for stack in stacks))
+
+    def test_write_errors_logged(self):
+        """
+        A profile that can't be written doesn't fail the request.
+        """
+        path = os.path.join(self.directory, 'file')
+        open(path, 'w').close()
+        with self.settings(PROFILER_DIR=os.path.join(path, 'profiles'), PROFILER_SAMPLE_RATE=1):
+            self.assertEqual(self.client.get(reverse('auth_login')).status_code, 200)
+
+
+class PersistentConnectionTest(TestCase):
+    """
+    Test the connections kept across requests by core.db.backends.persistent.
+    """
+
+    def setUp(self):
+        handle, self.path = tempfile.mkstemp()
+        os.close(handle)
+        self.wrappers = []
+
+    def tearDown(self):
+        request_finished()
+        for wrapper in self.wrappers:
+            wrapper.force_close()
+        _pools.pop('persistent-test', None)
+        os.remove(self.path)
+
+    def wrapper(self, **options):
+        settings_dict = {'ENGINE': 'core.db.backends.persistent', 'WRAPPED_ENGINE': 'django.db.backends.sqlite3',
+                         'NAME': self.path, 'USER': '', 'PASSWORD': '', 'HOST': '', 'PORT': '', 'OPTIONS': {}}
+        settings_dict.update(options)
+        wrapper = PersistentDatabaseWrapper(settings_dict, alias='persistent-test')
+        self.wrappers.append(wrapper)
+        return wrapper
+
+    def test_kept_after_request(self):
+        wrapper = self.wrapper()
+        request_started()
+        wrapper.cursor().execute('CREATE TABLE t (i INTEGER)')
+        wrapper.cursor().execute('INSERT INTO t VALUES (1)')
+        connection = wrapper.connection
+        wrapper.close()
+        request_finished()
+
+        self.assertIs(wrapper.connection, connection)
+        # The transaction left open was rolled back.
+        self.assertEqual(wrapper.cursor().execute('SELECT count(*) FROM t').fetchone(), (0,))
+
+    def test_closed_outside_request(self):
+        wrapper = self.wrapper()
+        wrapper.cursor()
+        wrapper.close()
+        self.assertIsNone(wrapper.connection)
+
+    def test_closed_when_old(self):
+        wrapper = self.wrapper(CONN_MAX_AGE=0)
+        request_started()
+        wrapper.cursor()
+        wrapper.close()
+        self.assertIsNone(wrapper.connection)
+
+    def test_pool(self):
+        first, second = self.wrapper(POOL_SIZE=1), self.wrapper(POOL_SIZE=1)
+        request_started()
+        first.cursor()
+        connection = first.connection
+        first.close()
+        self.assertIsNone(first.connection)
+
+        second.cursor()
+        self.assertIs(second.connection, connection)
+        # The pool is empty now: a connection of its own.
+        first.cursor()
+        self.assertIsNot(first.connection, connection)
+
+
+class WriteQueueTest(TestCase):
+    def test_runs_in_writer_thread(self):
+        """
+        Writes run one after the other in the writer thread; results and exceptions come back.
+        """
+        queue = WriteQueue()
+        self.assertEqual(queue.submit('default', lambda: threading.current_thread().name), 'db-writer')
+        self.assertFalse(queue.in_writer())
+        self.assertRaises(ZeroDivisionError, queue.submit, 'default', lambda: 1 / 0)
+        self.assertEqual(queue.submit('default', lambda x: x * 2, 21), 42)
+
+
+class SessionStoreTest(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_database_fallback(self):
+        """
+        Sessions are written through to the database and loaded from it when the cache lost them.
+        """
+        session = SessionStore()
+        session['foo'] = 'bar'
+        session.save()
+        self.assertTrue(Session.objects.filter(session_key=session.session_key).exists())
+
+        cache.clear()
+        self.assertEqual(SessionStore(session.session_key)['foo'], 'bar')
+
+        old_key = session.session_key
+        session.cycle_key()
+        # The old session is gone and the new one only written once saved.
+        self.assertFalse(Session.objects.filter(session_key__in=[old_key, session.session_key]).exists())
+        session.save()
+        self.assertEqual(SessionStore(session.session_key)['foo'], 'bar')
+
+    def test_deleted_not_reloaded(self):
+        """
+        A session deleted in the cache stays deleted until the deferred database delete runs.
+        """
+        deferred = []
+        self.addCleanup(setattr, sessions, 'defer', sessions.defer)
+        sessions.defer = lambda alias, func, *args: deferred.append((func, args))
+
+        session = SessionStore()
+        session['foo'] = 'bar'
+        session.save()
+        for func, args in deferred:
+            func(*args)
+        del deferred[:]
+        session_key = session.session_key
+
+        session.flush()
+        self.assertTrue(Session.objects.filter(session_key=session_key).exists())
+        self.assertFalse(SessionStore().exists(session_key))
+        stale = SessionStore(session_key)
+        self.assertNotIn('foo', stale)
+        self.assertNotEqual(stale.session_key, session_key)
+
+        for func, args in deferred:
+            func(*args)
+        self.assertFalse(Session.objects.filter(session_key=session_key).exists())
+
+    def test_clear_expired(self):
+        now = timezone.now()
+        for i in range(5):
+            Session.objects.create(session_key='expired%d' % i, session_data='',
+                                   expire_date=now - datetime.timedelta(days=1))
+        Session.objects.create(session_key='current', session_data='', expire_date=now + datetime.timedelta(days=1))
+
+        self.assertEqual(list(clear_expired(batch_size=2)), [2, 2, 1])
+        self.assertEqual(list(Session.objects.values_list('session_key', flat=True)), ['current'])
+
+
+class StaticFilesMiddlewareTest(TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        for name, content in (('app.0123456789ab.css', 'body {}'), ('app.0123456789ab.css.gz', 'gzipped')):
+            with open(os.path.join(self.root, name), 'wb') as f:
+                f.write(content)
+        self.middleware = StaticFilesMiddleware(self.django, root=self.root, prefix='/static/')
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def django(self, environ, start_response):
+        start_response('404 Not Found', [])
+        return ['django']
+
+    def get(self, path, **environ):
+        response = {}
+
+        def start_response(status, headers):
+            response.update(headers, status=status)
+
+        environ.update(REQUEST_METHOD='GET', PATH_INFO=path)
+        response['content'] = ''.join(self.middleware(environ, start_response))
+        return response
+
+    def test_negotiates_encoding(self):
+        """
+        Hashed files are cached for good and the precompressed variant goes to clients accepting it.
+        """
+        response = self.get('/static/app.0123456789ab.css', HTTP_ACCEPT_ENCODING='gzip, deflate')
+        self.assertEqual(response['content'], 'gzipped')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(response['Content-Type'], 'text/css')
+        self.assertIn('max-age=31536000', response['Cache-Control'])
+
+        response = self.get('/static/app.0123456789ab.css', HTTP_ACCEPT_ENCODING='gzip;q=0')
+        self.assertEqual(response['content'], 'body {}')
+        self.assertNotIn('Content-Encoding', response)
+
+        response = self.get('/static/app.0123456789ab.css', HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response['status'], '304 Not Modified')
+
+    def test_falls_through(self):
+        self.assertEqual(self.get('/static/missing.css')['content'], 'django')
+        self.assertEqual(self.get('/static/../etc/passwd')['content'], 'django')
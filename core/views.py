@@ -1,5 +1,25 @@
+from django.conf import settings
+from django.core.exceptions import PermissionDenied
+from django.http import HttpResponse
+from django.utils.decorators import method_decorator
 from django.views.generic.base import TemplateView
+from core.cache import cache_anonymous
+from core.metrics import REGISTRY
 
 
 class HomeTemplateView(TemplateView):
     template_name = 'index.html'
+
+    @method_decorator(cache_anonymous)
+    def dispatch(self, request, *args, **kwargs):
+        return super(HomeTemplateView, self).dispatch(request, *args, **kwargs)
+
+
+def metrics(request):
+    """
+    Expose the metrics of every worker in the Prometheus text format.
+    """
+    allowed_ips = getattr(settings, 'METRICS_ALLOWED_IPS', None)
+    if allowed_ips is not None and request.META.get('REMOTE_ADDR') not in allowed_ips:
+        raise PermissionDenied
+    return HttpResponse(REGISTRY.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
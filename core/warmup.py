@@ -0,0 +1,85 @@
+"""
+Do the work the first requests of a fresh process would otherwise pay for.
+
+Run it once in a prefork master (e.g. ``gunicorn --preload``) so the workers
+inherit the loaded URLconfs, compiled templates and translation catalogs.
+"""
+import logging
+import os
+import time
+
+import django
+from django.conf import settings
+from django.contrib.sites.models import Site
+from django.core.urlresolvers import get_resolver
+from django.db import connections
+from django.template.loader import get_template
+from django.template.loaders.app_directories import app_template_dirs
+from django.utils import translation
+
+logger = logging.getLogger(__name__)
+
+
+def load_urlconfs():
+    resolver = get_resolver(None)
+    # Imports ROOT_URLCONF (running admin.autodiscover) and every included URLconf.
+    resolver.reverse_dict
+    resolver.namespace_dict
+
+
+def project_template_dirs():
+    django_dir = os.path.dirname(django.__file__)
+    return [template_dir for template_dir in tuple(settings.TEMPLATE_DIRS) + app_template_dirs
+            if not template_dir.startswith(django_dir)]
+
+
+def compile_templates():
+    """
+    Compile every project template.
+
+    Only useful with the cached template loader, which keeps the result.
+    """
+    for template_dir in project_template_dirs():
+        for root, dirs, files in os.walk(template_dir):
+            for name in files:
+                get_template(os.path.relpath(os.path.join(root, name), template_dir))
+
+
+def load_translations():
+    translation.activate(settings.LANGUAGE_CODE)
+    translation.ugettext('Log in')
+    translation.deactivate()
+
+
+def open_connections():
+    for connection in connections.all():
+        connection.cursor()
+
+
+def close_connections():
+    # Connections must not be shared by the processes forked after this.
+    for connection in connections.all():
+        connection.close()
+
+
+STEPS = (
+    ('urlconfs', load_urlconfs),
+    ('templates', compile_templates),
+    ('translations', load_translations),
+    ('database', open_connections),
+    ('site', Site.objects.get_current),
+    ('close connections', close_connections),
+)
+
+
+def warm_up():
+    """
+    Run every warm-up step and return ``[(step, seconds), ...]``.
+    """
+    timings = []
+    for name, step in STEPS:
+        start = time.time()
+        step()
+        timings.append((name, time.time() - start))
+        logger.info('Warm-up step %s took %.1fms', name, timings[-1][1] * 1000)
+    return timings
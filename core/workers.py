@@ -0,0 +1,41 @@
+"""
+Queues consumed by a daemon thread of their own, started lazily in every process.
+"""
+import os
+import threading
+from Queue import Queue
+
+
+class QueueWorker(object):
+    """
+    Subclasses name the thread and consume ``self.queue`` in ``run()``.
+    """
+
+    name = None
+
+    def __init__(self):
+        self.queue = None
+        self.thread = None
+        self.pid = None
+        self.lock = threading.Lock()
+
+    def make_queue(self):
+        return Queue()
+
+    def ensure_started(self):
+        # Threads don't survive a fork: each process starts its own.
+        if self.pid == os.getpid():
+            return
+        with self.lock:
+            if self.pid != os.getpid():
+                self.queue = self.make_queue()
+                self.thread = threading.Thread(target=self.run, name=self.name)
+                self.thread.daemon = True
+                self.thread.start()
+                self.pid = os.getpid()
+
+    def is_started(self):
+        return self.pid == os.getpid()
+
+    def run(self):
+        raise NotImplementedError
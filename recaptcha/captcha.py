@@ -3,11 +3,15 @@
 
 import urllib2
 import urllib
+from core.metrics import Counter, Histogram
 
 API_SSL_SERVER = "https://www.google.com/recaptcha/api"
 API_SERVER = "http://www.google.com/recaptcha/api"
 VERIFY_SERVER = "www.google.com"
 
+VERIFY_SECONDS = Histogram('recaptcha_verify_seconds', 'Time spent verifying reCAPTCHA solutions.')
+VERIFY_RESULTS = Counter('recaptcha_verify_total', 'reCAPTCHA verifications by result.')
+
 
 class RecaptchaResponse(object):
     def __init__(self, is_valid, error_code=None):
@@ -60,6 +64,7 @@ def submit(recaptcha_challenge_field, recaptcha_response_field, private_key, rem
 
     if not (recaptcha_response_field and recaptcha_challenge_field and len(recaptcha_response_field) and len(
             recaptcha_challenge_field)):
+        VERIFY_RESULTS.inc(result='empty')
         return RecaptchaResponse(is_valid=False, error_code='incorrect-captcha-sol')
 
     def encode_if_necessary(s):
@@ -83,14 +88,17 @@ def submit(recaptcha_challenge_field, recaptcha_response_field, private_key, rem
         }
     )
 
-    httpresp = urllib2.urlopen(request)
+    with VERIFY_SECONDS.time():
+        httpresp = urllib2.urlopen(request)
 
-    return_values = httpresp.read().splitlines()
-    httpresp.close()
+        return_values = httpresp.read().splitlines()
+        httpresp.close()
 
     return_code = return_values[0]
 
     if return_code == "true":
+        VERIFY_RESULTS.inc(result='valid')
         return RecaptchaResponse(is_valid=True)
     else:
+        VERIFY_RESULTS.inc(result='invalid')
         return RecaptchaResponse(is_valid=False, error_code=return_values[1])
@@ -14,15 +14,71 @@ MANAGERS = ADMINS
 
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3', # Add 'postgresql_psycopg2', 'mysql', 'sqlite3' or 'oracle'.
+        # Keeps connections open across requests; the actual backend is WRAPPED_ENGINE.
+        'ENGINE': 'core.db.backends.persistent',
+        'WRAPPED_ENGINE': 'core.db.backends.sqlite3_wal', # SQLite in WAL mode. Add 'postgresql_psycopg2', 'mysql', 'sqlite3' or 'oracle'.
         'NAME': PROJECT_DIR.child('dev.db'), # Or path to database file if using sqlite3.
         'USER': '', # Not used with sqlite3.
         'PASSWORD': '', # Not used with sqlite3.
         'HOST': '', # Set to empty string for localhost. Not used with sqlite3.
         'PORT': '', # Set to empty string for default. Not used with sqlite3.
-    }
+        'CONN_MAX_AGE': 600, # Seconds a connection is reused for.
+        'CONN_HEALTH_CHECK_INTERVAL': 30, # Ping connections idle for longer than this before reusing them.
+        'POOL_SIZE': 0, # Idle connections shared by the threads of a process; 0 keeps one per thread.
+    },
+    # A second shard of the users, only used once listed in USER_SHARDS below. The tests use it.
+    'shard1': {
+        'ENGINE': 'core.db.backends.sqlite3_wal',
+        'NAME': PROJECT_DIR.child('shard1.db'),
+    },
 }
 
+# Reads of the accounts and auth tables go to these replicas of 'default', e.g. ('replica',) with a 'replica'
+# entry above. Locally that can be a second SQLite file kept in sync by "manage.py simulate_replication"; give
+# it a plain SQLite ENGINE, since persistent connections would keep reading the file it replaces, and
+# 'TEST_MIRROR': 'default' so the tests don't create it.
+DATABASE_REPLICAS = ()
+DATABASE_ROUTERS = ['accounts.routers.ShardRouter', 'accounts.routers.ReplicaRouter']
+
+# Databases holding the users, each one getting the users whose email hashes to it. After changing it, move the
+# existing users with "manage.py rebalance_shards".
+USER_SHARDS = ('default',)
+
+# After writing, a client reads from the primary for this many seconds.
+REPLICA_PIN_SECONDS = 5
+REPLICA_PIN_COOKIE_NAME = 'primary_until'
+
+# Run the user writes of each process one at a time in a single thread (see core.db.write_queue), rather than
+# having threads fight over the SQLite write lock.
+SERIALIZE_DB_WRITES = True
+
+# PBKDF2 runs in a pool of processes (see accounts.hashers); the other hashers only check old passwords. Hashers
+# are looked up by algorithm, so Django's own pbkdf2_sha256 hasher must not be listed too.
+PASSWORD_HASHERS = (
+    'accounts.hashers.CalibratedPBKDF2PasswordHasher',
+    'django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher',
+    'django.contrib.auth.hashers.BCryptPasswordHasher',
+    'django.contrib.auth.hashers.SHA1PasswordHasher',
+    'django.contrib.auth.hashers.MD5PasswordHasher',
+    'django.contrib.auth.hashers.CryptPasswordHasher',
+)
+PASSWORD_HASHING_PROCESSES = None # Defaults to the number of CPUs.
+PASSWORD_HASHING_QUEUE_SIZE = 8 # Hashes waiting for or running in the pool, past which they run inline.
+PASSWORD_HASHING_TIMEOUT = 1.0 # Seconds to wait for the pool before hashing inline.
+# PBKDF2 iterations for this host, written by "manage.py calibrate_hasher". Defaults to Django's 10000 if missing.
+PASSWORD_HASHING_ITERATIONS_FILE = PROJECT_DIR.child('password_iterations')
+
+# Calls deferred to the background thread of each process (see core.tasks) that may wait before running inline.
+TASK_QUEUE_SIZE = 1000
+
+# Registrations validated, inserted and answered together by the bulk registration API.
+BULK_REGISTER_CHUNK_SIZE = 100
+
+# The in-memory email directory behind the admin autocomplete picks up the users who joined meanwhile this often,
+# and is rebuilt from scratch this often (seconds).
+EMAIL_DIRECTORY_REFRESH_INTERVAL = 60
+EMAIL_DIRECTORY_REBUILD_INTERVAL = 3600
+
 # Local time zone for this installation. Choices can be found here:
 # http://en.wikipedia.org/wiki/List_of_tz_zones_by_name
 # although not all choices may be available on all operating systems.
@@ -80,6 +136,11 @@ STATICFILES_FINDERS = (
     #    'django.contrib.staticfiles.finders.DefaultStorageFinder',
 )
 
+# collectstatic writes content-hashed copies of the files, plus .gz (and .br with the brotli module) variants,
+# which core.static.StaticFilesMiddleware in wsgi.py serves. Hashed names are cached this long (seconds).
+STATICFILES_STORAGE = 'core.storage.CompressedCachedStaticFilesStorage'
+STATIC_HASHED_MAX_AGE = 365 * 24 * 3600
+
 # Make this unique, and don't share it with anybody.
 SECRET_KEY = '(ykv$6vl9hrh0%@!838=s0qqm++_$rg^lh#8m7tzl6@!2wyaql'
 
@@ -90,11 +151,20 @@ TEMPLATE_LOADERS = (
     #     'django.template.loaders.eggs.Loader',
 )
 
+# Keep compiled templates around in production, where the warm-up compiles them all before serving.
+if not DEBUG:
+    TEMPLATE_LOADERS = (
+        ('django.template.loaders.cached.Loader', TEMPLATE_LOADERS),
+    )
+
 MIDDLEWARE_CLASSES = (
+    'core.profiling.SamplingProfilerMiddleware',
+    'core.metrics.MetricsMiddleware',
+    'accounts.routers.ReplicaPinningMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
-    'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'accounts.middleware.ShardedAuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     # Uncomment the next line for simple clickjacking protection:
     # 'django.middleware.clickjacking.XFrameOptionsMiddleware',
@@ -180,6 +250,35 @@ LOGGING = {
     }
 }
 
+# How long the pages every anonymous visitor sees identically are served from the cache. Deploys that change
+# a template start over with fresh entries.
+ANONYMOUS_CACHE_TIMEOUT = 600
+
+# Sessions stay in the database by default. With a cache shared by all the processes, e.g. memcached, they
+# can live in the cache and be written to the database in the background (see core.sessions); clean the
+# database up with "manage.py clear_expired_sessions":
+# CACHES = {
+#     'default': {
+#         'BACKEND': 'django.core.cache.backends.memcached.MemcachedCache',
+#         'LOCATION': '127.0.0.1:11211',
+#     }
+# }
+# SESSION_ENGINE = 'core.sessions'
+
+# Metrics: every process dumps its counters here and /metrics merges them, so all the WSGI workers
+# of a deployment must share this directory.
+METRICS_DIR = PROJECT_DIR.child('metrics')
+METRICS_FLUSH_INTERVAL = 5
+METRICS_ALLOWED_IPS = ('127.0.0.1',)
+
+# Request profiling: sample this fraction of the requests, plus the ones from INTERNAL_IPS sending an
+# X-Profile header. Merge the samples with "manage.py profile_report".
+INTERNAL_IPS = ('127.0.0.1',)
+PROFILER_DIR = PROJECT_DIR.child('profiles')
+PROFILER_SAMPLE_RATE = 0
+PROFILER_HEADER = 'HTTP_X_PROFILE'
+PROFILER_URL_NAMES = ()
+
 # Email
 EMAIL_BACKEND = 'django.core.mail.backends.console.EmailBackend'
 EMAIL_HOST = 'localhost'
@@ -10,6 +10,8 @@ urlpatterns = patterns('',
                        # url(r'^admin/doc/', include('django.contrib.admindocs.urls')),
                        # Uncomment the next line to enable the admin:
                        url(r'^admin/', include(admin.site.urls)),
+                       # Prometheus scrapes
+                       url(r'^metrics$', 'core.views.metrics', name='metrics'),
                        # Accounts
                        url(r'^accounts/', include('accounts.urls')),
                        # Home
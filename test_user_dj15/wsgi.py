@@ -23,6 +23,15 @@ os.environ.setdefault("DJANGO_SETTINGS_MODULE", "test_user_dj15.settings")
 from django.core.wsgi import get_wsgi_application
 application = get_wsgi_application()
 
+# Pay the first-request costs now, e.g. once in the master of a preforking server, instead of in every worker.
+if os.environ.get('DJANGO_WARMUP'):
+    from core.warmup import warm_up
+    warm_up()
+
+# Serve the collected static files, precompressed and with far-future expiry for the hashed names, before Django.
+from core.static import StaticFilesMiddleware
+application = StaticFilesMiddleware(application)
+
 # Apply WSGI middleware here.
 # from helloworld.wsgi import HelloWorldApplication
 # application = HelloWorldApplication(application)